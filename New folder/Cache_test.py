@@ -0,0 +1,54 @@
+from probo.marketdata import MarketData
+from probo.payoff import VanillaPayoff, call_payoff
+from probo.engine import BlackScholesPricingEngine, BlackScholesPricer, MonteCarloPricingEngine, Naive_Monte_Carlo_Pricer
+from probo.facade import OptionFacade, PriceCache
+
+def main():
+    expiry = 0.25
+
+    spot = 41.0
+    rate = 0.08
+    volatility = 0.30
+    dividend = 0.0
+
+    cache = PriceCache(maxsize = 2)
+    the_data = MarketData(rate, spot, volatility, dividend)
+    bs_engine = BlackScholesPricingEngine("call", BlackScholesPricer)
+    options = [OptionFacade(VanillaPayoff(expiry, strike, call_payoff), bs_engine, the_data, cache)
+               for strike in (38.0, 40.0, 42.0)]
+
+    """A repeat request is a hit and returns the same price."""
+    price = options[0].price()
+    assert options[0].price() == price
+    assert (cache.hits, cache.misses, len(cache)) == (1, 1, 1)
+
+    """The least recently used entry is evicted once maxsize is exceeded."""
+    options[1].price()
+    options[0].price()
+    options[2].price()
+    assert len(cache) == 2
+    options[0].price()
+    assert (cache.hits, cache.misses) == (3, 3)
+    options[1].price()
+    assert (cache.hits, cache.misses) == (3, 4)
+
+    """A MarketData setter drops every entry priced off it."""
+    the_data.spot = 45.0
+    assert len(cache) == 0
+    assert options[1].price() > price
+    assert cache.misses == 5
+
+    """Monte Carlo engines without a seed are always priced afresh; seeded ones are cached."""
+    unseeded = OptionFacade(options[0].option, MonteCarloPricingEngine(1000, 1, Naive_Monte_Carlo_Pricer),
+                            the_data, cache)
+    unseeded.price()
+    unseeded.price()
+    assert (cache.hits, cache.misses, len(cache)) == (3, 5, 1)
+    seeded = OptionFacade(options[0].option, MonteCarloPricingEngine(1000, 1, Naive_Monte_Carlo_Pricer, seed = 1),
+                          the_data, cache)
+    assert seeded.price() == seeded.price()
+    assert (cache.hits, cache.misses) == (4, 6)
+    print("The price cache hit {0} and missed {1} times".format(cache.hits, cache.misses))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+from probo.marketdata import MarketData
+from probo.payoff import VanillaPayoff, call_payoff, put_payoff
+from probo.engine import FiniteDifferencePricingEngine, EuropeanFiniteDifferencePricer, AmericanFiniteDifferencePricer
+from probo.engine import BlackScholesPricingEngine, BlackScholesPricer, BinomialPricingEngine, AmericanBinomialPricer
+from probo.facade import OptionFacade
+
+def main():
+    expiry = 0.25
+    strike = 40.0
+
+    spot = 41.0
+    rate = 0.08
+    volatility = 0.30
+    dividend = 0.02
+    space_steps = 400
+    time_steps = 400
+    steps = 2001
+
+    the_data = MarketData(rate, spot, volatility, dividend)
+    for (payoff_type, payoff) in (("call", call_payoff), ("put", put_payoff)):
+        the_option = VanillaPayoff(expiry, strike, payoff)
+
+        """The grid price, delta, gamma and theta must agree with Black-Scholes."""
+        fd_engine = FiniteDifferencePricingEngine(space_steps, time_steps, EuropeanFiniteDifferencePricer)
+        bs_engine = BlackScholesPricingEngine(payoff_type, BlackScholesPricer)
+        grid = fd_engine.calculate_greeks(the_option, the_data)
+        exact = bs_engine.calculate_greeks(the_option, the_data)
+        for name in grid:
+            assert abs(grid[name] - exact[name]) < 1e-3 * max(1.0, abs(exact[name])), (payoff_type, name, grid[name], exact[name])
+
+        """The American grid price must agree with a fine Leisen-Reimer tree."""
+        fd_engine = FiniteDifferencePricingEngine(space_steps, time_steps, AmericanFiniteDifferencePricer)
+        tree_engine = BinomialPricingEngine(steps, AmericanBinomialPricer, lattice = "leisen-reimer")
+        price = OptionFacade(the_option, fd_engine, the_data).price()
+        tree_price = OptionFacade(the_option, tree_engine, the_data).price()
+        assert abs(price - tree_price) < 1e-3, (payoff_type, price, tree_price)
+        print("The American {0} price via finite differences is: {1:.4f}".format(payoff_type, price))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+import numpy as np
+
+from probo.engine import BlackScholesPricingEngine, BlackScholesPricer, BlackScholesBatchPricer
+
+def main():
+    spot = 100.0
+    rate = 0.05
+    dividend = 0.01
+
+    bs_engine = BlackScholesPricingEngine("call", BlackScholesPricer)
+    strike = np.linspace(50.0, 200.0, 31)
+    expiry = np.array([0.02, 0.25, 1.0, 5.0])[:, np.newaxis]
+    volatility = np.array([0.05, 0.2, 0.6, 1.5])[:, np.newaxis, np.newaxis]
+
+    """Prices from a grid of volatilities, calls and puts, deep in and out of the money,
+    must invert back to those volatilities."""
+    recovered = 0
+    for is_call in (True, False):
+        price = BlackScholesBatchPricer(strike, expiry, spot, volatility, rate, dividend, is_call)
+        (implied, converged) = bs_engine.implied_volatility(price, strike, expiry, spot, rate, dividend, is_call)
+        """Quotes whose time value is lost to rounding carry no volatility information."""
+        intrinsic = np.maximum((spot * np.exp(-dividend * expiry) - strike * np.exp(-rate * expiry))
+                               * (1.0 if is_call else -1.0), 0.0)
+        informative = price - intrinsic > 1e-10 * spot
+        assert converged[informative].all()
+        error = np.abs(implied - volatility * np.ones_like(price))[informative]
+        assert error.max() < 1e-6, error.max()
+        recovered += int(informative.sum())
+
+    """Quotes outside the no-arbitrage bounds get NaN and are not flagged as converged."""
+    (implied, converged) = bs_engine.implied_volatility(np.array([-1.0, 0.0, 150.0]), 100.0, 1.0, spot, rate)
+    assert np.isnan(implied).all() and not converged.any()
+    print("Implied volatilities recovered for {0} of {1} quotes".format(recovered, 2 * price.size))
+
+if __name__ == "__main__":
+    main()
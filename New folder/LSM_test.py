@@ -0,0 +1,41 @@
+from probo.marketdata import MarketData
+from probo.payoff import VanillaPayoff, call_payoff, put_payoff
+from probo.engine import LongstaffSchwartzPricingEngine, LongstaffSchwartzPricer
+from probo.engine import BinomialPricingEngine, AmericanBinomialPricer, BlackScholesPricingEngine, BlackScholesPricer
+from probo.facade import OptionFacade
+
+def main():
+    strike = 40.0
+    expiry = 0.25
+
+    spot = 41.0
+    rate = 0.08
+    volatility = 0.30
+    dividend = 0.0
+    time_steps = 51
+    replications = 50000
+
+    the_data = MarketData(rate, spot, volatility, dividend)
+
+    """The least-squares price is a lower bound and the duality estimate an upper bound on
+    a tree exercising on the same dates, up to three standard errors either side."""
+    the_put = VanillaPayoff(expiry, strike, put_payoff)
+    lsm_engine = LongstaffSchwartzPricingEngine(replications, time_steps, LongstaffSchwartzPricer,
+                                                seed = 1, bounds = True)
+    tree_engine = BinomialPricingEngine(time_steps, AmericanBinomialPricer, lattice = "leisen-reimer")
+    OptionFacade(the_put, lsm_engine, the_data).price()
+    ((lower, lower_error), (upper, upper_error)) = lsm_engine.bounds
+    tree_price = OptionFacade(the_put, tree_engine, the_data).price()
+    assert lower - 3.0 * lower_error <= tree_price <= upper + 3.0 * upper_error, (lower, tree_price, upper)
+    print("The put price is between {0:.3f} and {1:.3f}, the tree gives {2:.3f}".format(lower, upper, tree_price))
+
+    """Early exercise of a call without dividends is never optimal, so it prices as a European."""
+    the_call = VanillaPayoff(expiry, strike, call_payoff)
+    lsm_engine = LongstaffSchwartzPricingEngine(replications, time_steps, LongstaffSchwartzPricer, seed = 1)
+    result = OptionFacade(the_call, lsm_engine, the_data).price(result = True)
+    european = OptionFacade(the_call, BlackScholesPricingEngine("call", BlackScholesPricer), the_data).price()
+    assert abs(result.price - european) < 3.0 * result.std_error, (result, european)
+    print("The call price is {0:.3f} against {1:.3f} for the European".format(result.price, european))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import warnings
+
+import numpy as np
+
+from probo.marketdata import MarketData
+from probo.payoff import VanillaPayoff, call_payoff
+from probo.engine import MonteCarloPricingEngine, Naive_Monte_Carlo_Pricer, BlackScholesBatchPricer
+from probo.engine import Stratified, LatinHypercube, MomentMatched, Antithetic
+
+
+def main():
+    strike = 105.0
+    expiry = 1.0
+
+    spot = 100.0
+    rate = 0.05
+    volatility = 0.20
+    dividend = 0.0
+    time_steps = 1
+    replications = 8192
+    runs = 100
+
+    the_call = VanillaPayoff(expiry, strike, call_payoff)
+    the_data = MarketData(rate, spot, volatility, dividend)
+    exact = BlackScholesBatchPricer(strike, expiry, spot, volatility, rate, dividend)
+
+    """Moment matching must not bias the price, and the 95% confidence interval must cover
+    the exact price in about 95% of seeded runs."""
+    for sampling in ((MomentMatched(), ), (Stratified(), MomentMatched()),
+                     (LatinHypercube(), MomentMatched(), Antithetic())):
+        errors = []
+        covered = 0
+        for seed in range(runs):
+            engine = MonteCarloPricingEngine(replications, time_steps, Naive_Monte_Carlo_Pricer,
+                                             seed = seed, sampling = sampling)
+            result = engine.calculate(the_call, the_data, result = True)
+            errors.append(result.price - exact)
+            covered += result.confidence_interval[0] <= exact <= result.confidence_interval[1]
+        bias = np.mean(errors)
+        names = ", ".join(type(layer).__name__ for layer in sampling)
+        assert abs(bias) < 4.0 * np.std(errors) / np.sqrt(runs), (names, bias)
+        assert covered >= 0.85 * runs, (names, covered)
+        print("{0}: bias {1:.5f}, coverage {2:.0%}".format(names, bias, covered / runs))
+
+    """A single block of replications is still cut into two designs."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        engine = MonteCarloPricingEngine(256, time_steps, Naive_Monte_Carlo_Pricer, sampling = (MomentMatched(), ))
+        result = engine.calculate(the_call, the_data, result = True)
+        assert np.isfinite(result.std_error), result
+
+if __name__ == "__main__":
+    main()
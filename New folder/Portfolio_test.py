@@ -0,0 +1,44 @@
+import numpy as np
+
+from probo.marketdata import MarketData, MarketDataStore
+from probo.payoff import VanillaPayoff, call_payoff, put_payoff
+from probo.engine import BlackScholesPricingEngine, BlackScholesPricer, BinomialPricingEngine, EuropeanBinomialPricer
+from probo.facade import OptionFacade, PortfolioFacade
+
+def main():
+    market = {"ABC": MarketData(0.08, 41.0, 0.30, 0.0), "XYZ": MarketData(0.05, 100.0, 0.20, 0.02)}
+    trades = {"strike": np.array([40.0, 42.0, 95.0, 105.0, 38.0]),
+              "expiry": np.array([0.25, 0.5, 1.0, 0.75, 0.25]),
+              "payoff": np.array(["call", "put", "call", "put", "put"]),
+              "underlying": np.array(["ABC", "ABC", "XYZ", "XYZ", "ABC"]),
+              "engine": np.array(["bs", "tree", "bs", "tree", "bs"]),
+              "quantity": np.array([10.0, -5.0, 2.0, 1.0, -3.0])}
+    engines = {"bs": BlackScholesPricingEngine("call", BlackScholesPricer),
+               "tree": BinomialPricingEngine(501, EuropeanBinomialPricer, lattice = "leisen-reimer")}
+
+    """Every trade must price as it does through its own OptionFacade, whether its engine
+    prices the group in one batch (Black-Scholes, taking call or put from the payoff column)
+    or trade by trade (the tree)."""
+    expected = np.empty(len(trades["strike"]))
+    for i in range(len(expected)):
+        payoff = call_payoff if trades["payoff"][i] == "call" else put_payoff
+        option = VanillaPayoff(trades["expiry"][i], trades["strike"][i], payoff)
+        engine = engines[trades["engine"][i]]
+        if trades["engine"][i] == "bs":
+            engine = BlackScholesPricingEngine(trades["payoff"][i], BlackScholesPricer)
+        expected[i] = OptionFacade(option, engine, market[trades["underlying"][i]]).price()
+
+    for book_market in (market, MarketDataStore.from_market_data(market)):
+        columns = PortfolioFacade(trades, engines, book_market).price()
+        assert np.allclose(columns["price"], expected, rtol = 1e-12), (columns["price"], expected)
+        assert np.allclose(columns["value"], expected * trades["quantity"], rtol = 1e-12)
+
+    """With greeks the Black-Scholes trades carry their analytic Greeks, the others NaN."""
+    columns = PortfolioFacade(trades, engines, market).price(greeks = True)
+    batch = trades["engine"] == "bs"
+    assert np.isfinite(columns["delta"][batch]).all() and np.isnan(columns["delta"][~batch]).all()
+    assert np.allclose(columns["price"][batch], expected[batch], rtol = 1e-12)
+    print("The book is worth {0:.3f}".format((expected * trades["quantity"]).sum()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import numpy as np
+
+from probo.marketdata import MarketData, MarketDataStore
+from probo.payoff import VanillaPayoff, call_payoff
+from probo.engine import BlackScholesPricingEngine, BlackScholesPricer
+from probo.facade import OptionFacade, PriceCache
+
+def main():
+    market = {"ABC": MarketData(0.08, 41.0, 0.30, 0.0), "XYZ": MarketData(0.05, 100.0, 0.20, 0.02),
+              "QRS": MarketData(0.03, 20.0, 0.45, 0.01)}
+    store = MarketDataStore.from_market_data(market)
+
+    """get_data hands out read-only views of every underlying, or copies for given ids."""
+    (spot, rate, volatility, dividend) = store.get_data()
+    assert np.array_equal(spot, [41.0, 100.0, 20.0]) and not spot.flags.writeable
+    assert np.array_equal(store.get_data(["QRS", "ABC"])[0], [20.0, 41.0])
+    assert store.position("XYZ") == 1 and "ABC" in store and "DEF" not in store
+
+    """store[id] reads and writes through to the block; slices share it."""
+    view = store["XYZ"]
+    assert view.get_data() == market["XYZ"].get_data()
+    view.spot = 105.0
+    assert spot[1] == 105.0 and store[1:].spot[0] == 105.0
+
+    """update writes a tick in place and notifies the views it touched."""
+    notified = []
+    view.observe(notified.append)
+    store.update(["ABC"], spot = [42.0])
+    assert notified == [] and spot[0] == 42.0
+    store.update(["XYZ", "QRS"], spot = [110.0, 21.0], volatility = [0.25, 0.5])
+    assert notified == [view] and view.volatility == 0.25
+
+    """A store prices wherever a MarketData is expected, and a cache off it is invalidated
+    by updates."""
+    cache = PriceCache()
+    the_call = VanillaPayoff(0.25, 40.0, call_payoff)
+    option = OptionFacade(the_call, BlackScholesPricingEngine("call", BlackScholesPricer), store, cache)
+    prices = option.price()
+    assert prices.shape == (3, ) and np.array_equal(option.price(), prices) and cache.hits == 1
+    store.update(["ABC"], spot = [45.0])
+    assert len(cache) == 0 and option.price()[0] > prices[0]
+    print("The store prices {0} underlyings at once".format(len(store)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+import warnings
+
+import numpy as np
+
+from probo.marketdata import MarketData
+from probo.payoff import VanillaPayoff, call_payoff
+from probo.engine import MonteCarloPricingEngine, Stratified_Monte_Carlo_Pricer, BlackScholesBatchPricer
+
+
+def main():
+    strike = 40.0
+    expiry = .25
+
+    spot = 41.0
+    rate = 0.08
+    volatility = 0.30
+    dividend = 0.0
+    time_steps = 1
+
+    the_call = VanillaPayoff(expiry, strike, call_payoff)
+    the_data = MarketData(rate, spot, volatility, dividend)
+    exact = BlackScholesBatchPricer(strike, expiry, spot, volatility, rate, dividend)
+
+    """Runs of at most 2 * 256 replications fit in one chunk of fewer than two full designs;
+    the standard error must still come out finite, without a divide warning."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        for replications in (2, 3, 10, 100, 256, 300, 511, 1000):
+            engine = MonteCarloPricingEngine(replications, time_steps, Stratified_Monte_Carlo_Pricer, seed = 7)
+            result = engine.calculate(the_call, the_data, result = True)
+            assert np.isfinite(result.std_error) and result.std_error > 0.0, (replications, result)
+            assert abs(result.price - exact) < 5.0 * result.std_error + 0.05, (replications, result, exact)
+            print("{0:5d} replications: {1:.3f} +/- {2:.3f}".format(replications, result.price, result.std_error))
+
+if __name__ == "__main__":
+    main()
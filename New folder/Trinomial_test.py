@@ -0,0 +1,44 @@
+import numpy as np
+
+from probo.marketdata import MarketData
+from probo.payoff import VanillaPayoff, call_payoff, put_payoff
+from probo.engine import BinomialPricingEngine, EuropeanBinomialPricer, AmericanBinomialPricer
+from probo.engine import BuildLattice, BlackScholesBatchPricer
+
+
+def main():
+    expiry = 1.0
+    spot = 100.0
+    rate = 0.05
+    volatility = 0.20
+    dividend = 0.0
+
+    the_data = MarketData(rate, spot, volatility, dividend)
+
+    """Sweep the strike: every branch probability must stay non-negative, the European error
+    must stay within the first order bound at 100 steps and shrink at least threefold from
+    50 to 200 steps, and American puts must stay between intrinsic value and the strike."""
+    strikes = np.linspace(80.0, 120.0, 161)
+    errors = {}
+    for steps in (50, 100, 200):
+        european = BinomialPricingEngine(steps, EuropeanBinomialPricer, lattice = "trinomial")
+        errors[steps] = 0.0
+        for strike in strikes:
+            tree = BuildLattice("trinomial", steps, expiry, strike, spot, rate, volatility, dividend)
+            assert min(tree.probabilities) >= 0.0, (strike, tree.probabilities)
+            call = european.calculate(VanillaPayoff(expiry, strike, call_payoff), the_data)
+            exact = BlackScholesBatchPricer(strike, expiry, spot, volatility, rate, dividend)
+            errors[steps] = max(errors[steps], abs(call - exact))
+    assert errors[100] < 0.025, errors
+    assert errors[200] < errors[50] / 3.0, errors
+
+    american = BinomialPricingEngine(100, AmericanBinomialPricer, lattice = "trinomial")
+    for strike in strikes:
+        put = american.calculate(VanillaPayoff(expiry, strike, put_payoff), the_data)
+        assert max(strike - spot, 0.0) <= put < strike, (strike, put)
+
+    print("Largest European error by steps: {0}".format(
+        ", ".join("{0}: {1:.4f}".format(steps, error) for (steps, error) in errors.items())))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Startup benchmark for `import probo`.
+
+    python benchmarks/startup.py [repeats]
+
+Times `import probo` in fresh interpreters and lists the heaviest imports reported by
+`python -X importtime`, so regressions in package start-up show up next to their cause.
+"""
+import os
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_time(module = "probo"):
+    """Parse -X importtime output into a list of (cumulative microseconds, module name)."""
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module],
+                               cwd = ROOT, stderr = subprocess.PIPE, universal_newlines = True, check = True)
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        (self_us, cumulative_us, name) = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), name.strip()))
+    return rows
+
+
+def main(repeats = 5):
+    totals = []
+    for i in range(repeats):
+        rows = import_time()
+        totals.append(dict((name, us) for (us, name) in rows)["probo"])
+    print("import probo: best {0:.1f} ms, median {1:.1f} ms over {2} runs".format(
+        min(totals) / 1e3, sorted(totals)[len(totals) // 2] / 1e3, repeats))
+    top_level = [(us, name) for (us, name) in rows if "." not in name]
+    print("heaviest top-level imports:")
+    for (us, name) in sorted(top_level, reverse = True)[:10]:
+        print("  {0:>8.1f} ms  {1}".format(us / 1e3, name))
+    loaded = set(name for (us, name) in rows)
+    for optional in ("matplotlib", "scipy"):
+        print("{0} loaded at startup: {1}".format(optional, optional in loaded))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
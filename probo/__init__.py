@@ -2,3 +2,11 @@ from .facade import *
 from .payoff import * 
 from .engine import *
 from .marketdata import *
+
+
+def __getattr__(name):
+    """Load the plotting helpers in probo.diagnostics (and matplotlib) only on first use."""
+    if name == "diagnostics":
+        import importlib
+        return importlib.import_module(__name__ + ".diagnostics")
+    raise AttributeError("module 'probo' has no attribute '{}'".format(name))
@@ -0,0 +1,27 @@
+"""Opt-in plotting for Monte Carlo runs.  This is the only module that imports matplotlib;
+load it explicitly (import probo.diagnostics) when you want the pictures."""
+import numpy as np
+from matplotlib import pyplot
+
+
+def plot_paths(engine, option, data, replications = 20):
+    """Plot a handful of the GBM paths the engine simulates for this option."""
+    rng = np.random.default_rng(engine.seed)
+    paths = engine.paths(option, data, replications, engine.time_steps, rng)
+    times = np.linspace(0.0, option.expiry, paths.shape[1])
+    pyplot.title("Simulated paths")
+    pyplot.plot(times, paths.T)
+    return paths
+
+
+def hist_samples(engine, sampler, option, data, replications = None, bins = 50, title = None):
+    """Histogram of the discounted samples one Monte Carlo sampler produces, e.g.
+    hist_samples(engine, probo.engine._control_variate_samples, option, data)."""
+    if replications is None:
+        replications = engine.replications
+    rng = np.random.default_rng(engine.seed)
+    samples = sampler(engine, option, data, rng, int(replications))
+    if title is not None:
+        pyplot.title(title)
+    pyplot.hist(samples, bins = bins)
+    return samples
@@ -1,9 +1,15 @@
+"""Pricing engines.  scipy is imported inside the functions that need it and plotting lives in
+probo.diagnostics, so importing the package only costs numpy."""
 import abc
 import enum
+import functools
+import time
+import warnings
+from collections import namedtuple
 import numpy as np
-from numpy import matlib
-from scipy.stats import binom, norm, mstats
-from matplotlib.pyplot import *
+from .payoff import TERMINAL, AVERAGE, GEOMETRIC_AVERAGE, MAXIMUM, MINIMUM
+from .payoff import arithmetic_asian_call_payoff, arithmetic_asian_put_payoff
+from .payoff import floating_strike_asian_call_payoff, floating_strike_asian_put_payoff
 
 class PricingEngine(object, metaclass=abc.ABCMeta):
     
@@ -13,13 +19,100 @@ class PricingEngine(object, metaclass=abc.ABCMeta):
            The pricing method may be either an analytic model (i.e.
            Black-Scholes), a PDF solver such as the finite difference method,
            or a Monte Carlo pricing algorithm.
+           Engines return the price, or a PricingResult when called with result = True.
         """
         pass
+
+    """Attributes holding the outcome of the last run rather than configuration; they are left
+    out of cache_key."""
+    _results = ()
+
+    def cache_key(self):
+        """A hashable snapshot of the engine's type and configuration, used by PriceCache, or
+        None when the engine's prices are not reproducible and must not be cached."""
+        return (type(self), _state_key(self, self._results))
+
+
+def _state_key(obj, skip = ()):
+    """The instance attributes of obj as a hashable, name-sorted tuple, less those in skip."""
+    return tuple((name, _hashable(value)) for (name, value) in sorted(vars(obj).items())
+                 if name.rpartition("__")[2] not in skip)
+
+
+def _hashable(value):
+    if isinstance(value, np.ndarray):
+        return (value.dtype.str, value.shape, value.tobytes())
+    if isinstance(value, (tuple, list)):
+        return tuple(_hashable(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _hashable(item)) for (key, item) in value.items()))
+    if hasattr(value, "__dict__") and not callable(value):
+        return (type(value), _state_key(value))
+    return value
+
+
+class PricingResult(namedtuple("PricingResult", "price std_error confidence_interval replications elapsed "
+                                                 "variance_reduction", defaults = (None, ))):
+    """A lightweight pricing record: the price, its standard error and 95% confidence interval,
+    the number of paths simulated (None for deterministic engines) and the wall time in seconds.
+    Variance-reduced Monte Carlo pricers also report the ratio of the plain estimator's variance
+    to their own in variance_reduction."""
+    __slots__ = ()
+
+    @classmethod
+    def from_estimate(cls, price, std_error, replications = None, elapsed = 0.0, variance_reduction = None):
+        half_width = CONFIDENCE_Z * std_error
+        return cls(price, std_error, (price - half_width, price + half_width), replications, elapsed,
+                   variance_reduction)
+
+
+CONFIDENCE_Z = 1.959963984540054
+
+
+def _finish(outcome, start, result):
+    """Pricers may return a bare price or a PricingResult; stamp the wall time and hand back
+    whichever form the caller asked for."""
+    if not isinstance(outcome, PricingResult):
+        outcome = PricingResult.from_estimate(outcome, 0.0)
+    if not result:
+        return outcome.price
+    return outcome._replace(elapsed = time.perf_counter() - start)
+
+
+def _term_values(strike, expiry, rate, volatility, dividend):
+    """Evaluate a YieldCurve rate or dividend yield and a VolatilitySurface volatility at the
+    strikes and expiries, in one array operation each; flat values pass straight through."""
+    if hasattr(rate, "zero_rate"):
+        rate = rate.zero_rate(expiry)
+    if hasattr(dividend, "zero_rate"):
+        dividend = dividend.zero_rate(expiry)
+    if hasattr(volatility, "volatility"):
+        volatility = volatility.volatility(strike, expiry)
+    return (rate, volatility, dividend)
+
+
+def MarketInputs(data, option):
+    """data.get_data() with any term structures resolved at the option's strike and expiry, so
+    every engine prices off the zero rate and implied volatility for that option."""
+    (spot, rate, volatility, dividend) = data.get_data()
+    (rate, volatility, dividend) = _term_values(getattr(option, "strike", None), option.expiry,
+                                                rate, volatility, dividend)
+    return (spot, rate, volatility, dividend)
+
         
 class BinomialPricingEngine(PricingEngine):
-    def __init__(self, steps, pricer):
+    """Lattice engine.  lattice picks the tree: "crr" (the drift-adjusted Cox-Ross-Rubinstein
+    tree), "trinomial" (a log-spot trinomial tree) or "leisen-reimer" (a binomial tree centred
+    on the strike with Peizer-Pratt inversion, run on an odd number of steps).  With
+    richardson = True the pricers extrapolate from steps and steps / 2, which only the
+    Leisen-Reimer tree converges smoothly enough for."""
+    def __init__(self, steps, pricer, lattice = "crr", richardson = False):
+        if lattice not in LATTICES:
+            raise ValueError("lattice must be one of " + ", ".join(LATTICES) + ".")
         self.__steps = steps
         self.__pricer = pricer
+        self.__lattice = lattice
+        self.richardson = richardson
 
     @property
     def steps(self):
@@ -28,66 +121,150 @@ class BinomialPricingEngine(PricingEngine):
     @steps.setter
     def steps(self, new_steps):
         self.__steps = new_steps
+
+    @property
+    def lattice(self):
+        return self.__lattice
+
+    @property
+    def richardson(self):
+        return self.__richardson
+
+    @richardson.setter
+    def richardson(self, new_richardson):
+        if new_richardson and self.__lattice != "leisen-reimer":
+            raise ValueError("richardson needs the leisen-reimer lattice.")
+        self.__richardson = new_richardson
     
-    def calculate(self, option, data):
-        return self.__pricer(self, option, data)
+    def calculate(self, option, data, result = False):
+        start = time.perf_counter()
+        return _finish(self.__pricer(self, option, data), start, result)
+
+
+LATTICES = ("crr", "trinomial", "leisen-reimer")
+
+Lattice = namedtuple("Lattice", "steps up ratio probabilities discount")
+Lattice.__doc__ = """A recombining tree: the top node at step i is spot * up ** i and each node below it is
+ratio times the one above.  probabilities holds the undiscounted branch probabilities from the
+top branch down, and discount is the one-step discount factor."""
+
+
+def _peizer_pratt(z, steps):
+    """Peizer-Pratt method 2 inversion of the normal distribution onto a binomial with steps steps."""
+    return 0.5 + np.copysign(np.sqrt(0.25 - 0.25 * np.exp(-(z / (steps + 1.0 / 3.0 + 0.1 / (steps + 1))) ** 2
+                                                          * (steps + 1.0 / 6.0))), z)
+
+
+def BuildLattice(lattice, steps, expiry, strike, spot, rate, volatility, dividend):
+    steps = int(steps)
+    if lattice == "crr":
+        delta_t = expiry / steps
+        growth = np.exp((rate - dividend) * delta_t)
+        u = growth * np.exp(volatility * np.sqrt(delta_t))
+        d = growth * np.exp(-volatility * np.sqrt(delta_t))
+        pu = (growth - d) / (u - d)
+        return Lattice(steps, u, d / u, (pu, 1 - pu), np.exp(-rate * delta_t))
+
+    if lattice == "trinomial":
+        delta_t = expiry / steps
+        nu = rate - dividend - 0.5 * volatility * volatility
+        dx = volatility * np.sqrt(3.0 * delta_t)
+        second = (volatility * volatility * delta_t + nu * nu * delta_t * delta_t) / (dx * dx)
+        pu = 0.5 * (second + nu * delta_t / dx)
+        pd = 0.5 * (second - nu * delta_t / dx)
+        probabilities = (pu, 1 - pu - pd, pd)
+        if min(probabilities) < 0:
+            raise ValueError("Trinomial branch probabilities are negative; increase the number of steps.")
+        u = np.exp(dx)
+        return Lattice(steps, u, 1 / u, probabilities, np.exp(-rate * delta_t))
+
+    steps += 1 - steps % 2
+    delta_t = expiry / steps
+    vol_sqrt_t = volatility * np.sqrt(expiry)
+    d1 = (np.log(spot / strike) + (rate - dividend) * expiry) / vol_sqrt_t + 0.5 * vol_sqrt_t
+    pu = _peizer_pratt(d1 - vol_sqrt_t, steps)
+    growth = np.exp((rate - dividend) * delta_t)
+    u = growth * _peizer_pratt(d1, steps) / pu
+    d = (growth - pu * u) / (1 - pu)
+    return Lattice(steps, u, d / u, (pu, 1 - pu), np.exp(-rate * delta_t))
+
+
+def LatticeRollback(tree, option, spot, american):
+    """Backward induction over a whole time slice at a time; with american the slice is
+    floored at the exercise value, so the payoff is evaluated once per step on an array."""
+    branches = len(tree.probabilities)
+    steps = tree.steps
+    nodes = steps * (branches - 1) + 1
+    spot_t = spot * tree.up ** steps * tree.ratio ** np.arange(nodes)
+    payoff_t = option.payoff(spot_t)
+    exercise = np.empty(nodes)
+    probabilities = [tree.discount * p for p in tree.probabilities]
+    for i in range((steps - 1), -1, -1):
+        width = i * (branches - 1) + 1
+        rolled = probabilities[0] * payoff_t[:width]
+        for k in range(1, branches):
+            rolled += probabilities[k] * payoff_t[k:k + width]
+        payoff_t = rolled
+        if american:
+            spot_t = spot_t[:width]
+            spot_t /= tree.up
+            np.maximum(payoff_t, option.payoff(spot_t, out = exercise[:width]), out = payoff_t)
+    return payoff_t[0]
+
+
+def _lattice_price(engine, option, data, price, american):
+    """Run price(tree, spot) on the engine's lattice and, when the engine asks for it, Richardson
+    extrapolate from steps and steps / 2.  The engine only allows that on the Leisen-Reimer
+    tree, which converges at second order on Europeans and first order on Americans; the
+    odd-even flip of CRR and the strike moving between trinomial nodes as steps change make
+    their errors too irregular to extrapolate.  A tree too small to halve is returned as is."""
+    (spot, rate, volatility, dividend) = MarketInputs(data, option)
+    build = lambda steps: BuildLattice(engine.lattice, steps, option.expiry, option.strike,
+                                       spot, rate, volatility, dividend)
+    fine = build(engine.steps)
+    fine_price = price(fine, spot)
+    if not engine.richardson:
+        return fine_price
+    coarse = build(max(engine.steps // 2, 1))
+    if coarse.steps == fine.steps:
+        return fine_price
+    coarse_price = price(coarse, spot)
+    order = 1 if american else 2
+    weight_fine = fine.steps ** order
+    weight_coarse = coarse.steps ** order
+    return (weight_fine * fine_price - weight_coarse * coarse_price) / (weight_fine - weight_coarse)
 
     
 def EuropeanBinomialPricer(engine, option, data):
     """Price Engine for European Call and Put options via a binomial (tree) pricing method.
     Collecting inputs from option and data classes plus the inputs necessary to build tree."""
-    expiry = option.expiry
-    strike = option.strike
-    (spot, rate, volatility, dividend) = data.get_data()
-    steps = engine.steps
-    nodes = steps + 1
-    delta_t = expiry / steps 
-    u = np.exp((rate * delta_t) + volatility * np.sqrt(delta_t)) 
-    d = np.exp((rate * delta_t) - volatility * np.sqrt(delta_t))
-    pu = (np.exp(rate * delta_t) - d) / (u - d)
-    pd = 1 - pu
-    discount_rate = np.exp(-rate * expiry)
-    spot_T = 0.0
-    payoff_T = 0.0
-    
-    for i in range(nodes):
-        spot_T = spot * (u ** (steps - i)) * (d ** (i))
-        payoff_T += option.payoff(spot_T)  * binom.pmf(steps - i, steps, pu)  
-    price = discount_rate * payoff_T 
-     
-    return price 
+    def european(tree, spot):
+        if len(tree.probabilities) == 3:
+            return LatticeRollback(tree, option, spot, american = False)
+        """Terminal spots and binomial weights for every node in one pass, kept in log space
+        so that large step counts neither overflow u ** steps nor underflow pu ** steps."""
+        from scipy.special import gammaln
+        steps = tree.steps
+        nodes = steps + 1
+        (pu, pd) = tree.probabilities
+        i = np.arange(nodes)
+        spot_T = np.exp(np.log(spot) + steps * np.log(tree.up) + i * np.log(tree.ratio))
+        log_weights = (gammaln(nodes) - gammaln(steps - i + 1) - gammaln(i + 1)
+                       + (steps - i) * np.log(pu) + i * np.log(pd))
+        payoff_T = np.dot(np.exp(log_weights), option.payoff(spot_T))
+        return tree.discount ** steps * payoff_T
+
+    return _lattice_price(engine, option, data, european, american = False)
 
 
 def AmericanBinomialPricer(engine, option, data):
-    expiry = option.expiry
-    strike = option.strike
-    (spot, rate, volatility, dividend) = data.get_data()
-    steps = engine.steps
-    nodes = steps + 1
-    delta_t = expiry / steps
-    discount_rate = np.exp(-rate * delta_t)
-    u = np.exp((rate * delta_t) + volatility * np.sqrt(delta_t))
-    d = np.exp((rate * delta_t) - volatility * np.sqrt(delta_t))
-    pu = (np.exp(rate * delta_t) - d) / (u - d)
-    pd = 1 - pu
-    disc_pu = discount_rate * pu
-    disc_pd = discount_rate * pd
-    spot_t = np.zeros((nodes, ))
-    payoff_t = np.zeros((nodes, ))
-    
-    for i in range(nodes):
-        spot_t[i] = spot * (u ** (steps - i)) * (d ** i)
-        payoff_t[i] = option.payoff(spot_t[i])
+    """Price Engine for American Call and Put options via a binomial (tree) pricing method.
+    The backward recursion rolls a whole time slice back at once and checks early
+    exercise on the slice, so the option payoff is evaluated once per step on an array."""
+    def american(tree, spot):
+        return LatticeRollback(tree, option, spot, american = True)
 
-    """Backwards Recursion portion of the American Binomial Model"""
-    for i in range((steps - 1), -1, -1):
-        for j in range(i + 1):
-            payoff_t[j] = disc_pu * payoff_t[j] + disc_pd * payoff_t[j+1]
-            spot_t[j] = spot_t[j] / u
-            payoff_t[j] = np.maximum(payoff_t[j], option.payoff(spot_t[j])) 
-            
-    price = payoff_t[0]
-    return price
+    return _lattice_price(engine, option, data, american, american = True)
 
 
                
@@ -100,32 +277,429 @@ class BlackScholesPricingEngine(PricingEngine):
     def payoff_type(self):
         return self.__payoff_type
 
-    def calculate(self, option, data):
-        return self.__pricer(self, option, data)
+    def calculate(self, option, data, result = False):
+        start = time.perf_counter()
+        return _finish(self.__pricer(self, option, data), start, result)
 
-def BlackScholesPricer(pricing_engine, option, data):
-    strike = option.strike
-    expiry = option.expiry
-    (spot, rate, volatility, dividend) = data.get_data()
-    d1 = (np.log(spot/strike) + (rate - dividend + 0.5 * volatility * volatility) * expiry) / (volatility * np.sqrt(expiry))
-    d2 = d1 - volatility * np.sqrt(expiry) 
+    def calculate_batch(self, strike, expiry, spot, volatility, rate, dividend = 0.0, is_call = None):
+        """Price a whole chain in one vectorized pass.  All inputs broadcast against each other,
+        e.g. strikes of shape (40,), expiries of shape (12, 1) and spots of shape (3000, 1, 1)
+        price the full surface.  When is_call is not given the engine's payoff_type is used.
+        rate and dividend may be YieldCurves and volatility a VolatilitySurface."""
+        if is_call is None:
+            is_call = _is_call(self.__payoff_type)
+        (rate, volatility, dividend) = _term_values(strike, expiry, rate, volatility, dividend)
+        return BlackScholesBatchPricer(strike, expiry, spot, volatility, rate, dividend, is_call)
+
+    def calculate_greeks(self, option, data):
+        """Price and analytic Greeks for a single option, as a dict of floats."""
+        (spot, rate, volatility, dividend) = MarketInputs(data, option)
+        greeks = BlackScholesBatchGreeks(option.strike, option.expiry, spot, volatility, rate,
+                                         dividend, _is_call(self.__payoff_type))
+        return {name: value[()] for (name, value) in greeks.items()}
+
+    def calculate_greeks_batch(self, strike, expiry, spot, volatility, rate, dividend = 0.0, is_call = None):
+        """Price, delta, gamma, vega, theta and rho for a whole chain in one vectorized pass.
+        Inputs broadcast as in calculate_batch."""
+        if is_call is None:
+            is_call = _is_call(self.__payoff_type)
+        (rate, volatility, dividend) = _term_values(strike, expiry, rate, volatility, dividend)
+        return BlackScholesBatchGreeks(strike, expiry, spot, volatility, rate, dividend, is_call)
+
+    def implied_volatility(self, price, strike, expiry, spot, rate, dividend = 0.0, is_call = None):
+        """Implied volatilities and per-quote convergence flags for arrays of quoted prices.
+        Inputs broadcast as in calculate_batch."""
+        if is_call is None:
+            is_call = _is_call(self.__payoff_type)
+        (rate, _, dividend) = _term_values(strike, expiry, rate, None, dividend)
+        return BlackScholesImpliedVolatility(price, strike, expiry, spot, rate, dividend, is_call)
 
-    if pricing_engine.payoff_type == "call":
-        price = (spot * np.exp(-dividend * expiry) * norm.cdf(d1)) - (strike * np.exp(-rate * expiry) * norm.cdf(d2)) 
-    elif pricing_engine.payoff_type == "put":
-        price = (strike * np.exp(-rate * expiry) * norm.cdf(-d2)) - (spot * np.exp(-dividend * expiry) * norm.cdf(-d1))
+
+def _is_call(payoff_type):
+    if payoff_type == "call":
+        return True
+    elif payoff_type == "put":
+        return False
     else:
         raise ValueError("You must pass either a call or a put option.")
+
+
+def _black_scholes_terms(strike, expiry, spot, volatility, rate, dividend, is_call):
+    """Shared terms for the batch price and Greeks.  Discount factors are computed on the
+    broadcast of (rate, expiry) and (dividend, expiry) only, and a single cdf per d-term
+    serves both calls and puts via the sign flag phi."""
+    from scipy.special import ndtr
+    strike = np.asarray(strike, dtype = np.float64)
+    expiry = np.asarray(expiry, dtype = np.float64)
+    spot = np.asarray(spot, dtype = np.float64)
+    volatility = np.asarray(volatility, dtype = np.float64)
+    rate = np.asarray(rate, dtype = np.float64)
+    dividend = np.asarray(dividend, dtype = np.float64)
+    phi = np.where(is_call, 1.0, -1.0)
+
+    sqrt_t = np.sqrt(expiry)
+    vol_sqrt_t = volatility * sqrt_t
+    spot_disc = spot * np.exp(-dividend * expiry)
+    strike_disc = strike * np.exp(-rate * expiry)
+    d1 = np.log(spot_disc / strike_disc) / vol_sqrt_t + 0.5 * vol_sqrt_t
+    d2 = d1 - vol_sqrt_t
+    cdf_d1 = ndtr(phi * d1)
+    cdf_d2 = ndtr(phi * d2)
+    return (phi, sqrt_t, vol_sqrt_t, spot_disc, strike_disc, d1, cdf_d1, cdf_d2)
+
+
+def BlackScholesBatchPricer(strike, expiry, spot, volatility, rate, dividend = 0.0, is_call = True):
+    """Black-Scholes prices for broadcastable arrays of inputs and call/put flags."""
+    (phi, sqrt_t, vol_sqrt_t, spot_disc, strike_disc, d1, cdf_d1, cdf_d2) = _black_scholes_terms(
+        strike, expiry, spot, volatility, rate, dividend, is_call)
+    price = phi * (spot_disc * cdf_d1 - strike_disc * cdf_d2)
     return price
+
+
+def BlackScholesBatchGreeks(strike, expiry, spot, volatility, rate, dividend = 0.0, is_call = True):
+    """Black-Scholes price, delta, gamma, vega, theta and rho for broadcastable arrays of inputs,
+    returned as a dict of arrays.  All six reuse the same d1/d2, cdf and pdf terms.  Vega and rho
+    are per unit change in volatility and rate, theta is the derivative in calendar time (per year)."""
+    (phi, sqrt_t, vol_sqrt_t, spot_disc, strike_disc, d1, cdf_d1, cdf_d2) = _black_scholes_terms(
+        strike, expiry, spot, volatility, rate, dividend, is_call)
+    spot = np.asarray(spot, dtype = np.float64)
+    expiry = np.asarray(expiry, dtype = np.float64)
+    pdf_d1 = np.exp(-0.5 * d1 * d1) / np.sqrt(2.0 * np.pi)
+    spot_term = spot_disc * cdf_d1
+    strike_term = strike_disc * cdf_d2
+    spot_pdf = spot_disc * pdf_d1
+
+    greeks = {
+        "price": phi * (spot_term - strike_term),
+        "delta": phi * spot_term / spot,
+        "gamma": spot_pdf / (spot * spot * vol_sqrt_t),
+        "vega": spot_pdf * sqrt_t,
+        "theta": (-0.5 * spot_pdf * vol_sqrt_t / expiry
+                  + phi * (np.asarray(dividend) * spot_term - np.asarray(rate) * strike_term)),
+        "rho": phi * expiry * strike_term,
+    }
+    return greeks
+
+
+def BlackScholesImpliedVolatility(price, strike, expiry, spot, rate, dividend = 0.0, is_call = True,
+                                  tolerance = 1e-8, max_iterations = 50):
+    """Invert Black-Scholes prices to volatilities for broadcastable arrays of quotes.
+    In-the-money quotes are first mapped to their out-of-the-money counterpart by put-call parity,
+    where the time value is not swamped by intrinsic value.  Uses Halley steps on the analytic
+    vega and vomma, falling back to bisection whenever a step would leave the bracket maintained
+    for each quote or fails to halve the step taken two rounds earlier.  A quote has converged once its Newton
+    step or its bracket is narrower than tolerance (in volatility units).  Converged quotes are
+    dropped from the working set so every round only reprices the quotes still moving.
+    Returns (volatility, converged); quotes outside the no-arbitrage bounds get NaN."""
+    (price, strike, expiry, spot, rate, dividend, is_call) = np.broadcast_arrays(
+        *(np.asarray(x, dtype = np.float64) for x in (price, strike, expiry, spot, rate, dividend)),
+        np.asarray(is_call, dtype = bool))
+    shape = price.shape
+    (price, strike, expiry, spot, rate, dividend, is_call) = (
+        x.ravel() for x in (price, strike, expiry, spot, rate, dividend, is_call))
+
+    spot_disc = spot * np.exp(-dividend * expiry)
+    strike_disc = strike * np.exp(-rate * expiry)
+    lower = np.where(is_call, np.maximum(spot_disc - strike_disc, 0.0), np.maximum(strike_disc - spot_disc, 0.0))
+    upper = np.where(is_call, spot_disc, strike_disc)
+    valid = (price > lower) & (price < upper) & (expiry > 0.0)
+    in_the_money = np.where(is_call, spot_disc > strike_disc, strike_disc > spot_disc)
+    price = np.where(in_the_money, price - lower, price)
+    is_call = is_call ^ in_the_money
+
+    """Start from the inflection point of the price in volatility (Manaster-Koehler), which
+    Newton-type steps converge from monotonically; near the money use Brenner-Subrahmanyam."""
+    log_moneyness = np.abs(np.log(spot_disc / strike_disc))
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        sigma = np.sqrt(2.0 * log_moneyness / expiry)
+        atm_guess = np.sqrt(2.0 * np.pi / expiry) * price / spot_disc
+    sigma = np.where(sigma < 1e-2, atm_guess, sigma)
+    sigma_low = np.zeros_like(sigma)
+    sigma_high = np.full_like(sigma, 10.0)
+    sigma = np.clip(np.nan_to_num(sigma, nan = 0.2), 1e-4, 5.0)
+    step_last = sigma_high - sigma_low
+    step_old = step_last.copy()
+
+    converged = np.zeros(shape = price.shape, dtype = bool)
+    active = np.flatnonzero(valid)
+    for iteration in range(max_iterations):
+        if active.size == 0:
+            break
+        sig = sigma[active]
+        (phi, sqrt_t, vol_sqrt_t, sd, kd, d1, cdf_d1, cdf_d2) = _black_scholes_terms(
+            strike[active], expiry[active], spot[active], sig, rate[active], dividend[active], is_call[active])
+        error = phi * (sd * cdf_d1 - kd * cdf_d2) - price[active]
+        vega = sd * np.exp(-0.5 * d1 * d1) / np.sqrt(2.0 * np.pi) * sqrt_t
+
+        low = np.where(error < 0.0, sig, sigma_low[active])
+        high = np.where(error > 0.0, sig, sigma_high[active])
+
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            newton = error / vega
+            done = (np.abs(newton) <= tolerance) | (high - low <= tolerance)
+            converged[active[done]] = True
+            d2 = d1 - vol_sqrt_t
+            halley = 1.0 - 0.5 * newton * d1 * d2 / sig
+            step = np.where(halley > 0.5, newton / halley, newton)
+        new_sig = sig - step
+        bad = (~np.isfinite(new_sig) | (new_sig <= low) | (new_sig >= high)
+               | (np.abs(step) > 0.5 * step_old[active]))
+        new_sig = np.where(bad, 0.5 * (low + high), new_sig)
+        step_old[active] = step_last[active]
+        step_last[active] = np.abs(sig - new_sig)
+
+        keep = ~done
+        sigma[active[keep]] = new_sig[keep]
+        sigma_low[active] = low
+        sigma_high[active] = high
+        active = active[keep]
+
+    volatility = np.where(valid, sigma, np.nan).reshape(shape)
+    return (volatility, converged.reshape(shape))
+
+
+def BlackScholesPricer(pricing_engine, option, data):
+    strike = option.strike
+    expiry = option.expiry
+    (spot, rate, volatility, dividend) = MarketInputs(data, option)
+    is_call = _is_call(pricing_engine.payoff_type)
+    price = BlackScholesBatchPricer(strike, expiry, spot, volatility, rate, dividend, is_call)
+    return price[()]
     
     
     
 
+class FiniteDifferencePricingEngine(PricingEngine):
+    """Crank-Nicolson finite differences for the Black-Scholes PDE in log spot.  The grid has
+    space_steps intervals spanning width standard deviations either side of the spot (widened to
+    take in the strike), with the spot on a node.  The first rannacher_steps time steps are
+    fully implicit to damp the oscillations a payoff kink excites in Crank-Nicolson, and each
+    step is one O(N) tridiagonal (banded) solve.  Price, delta, gamma and theta are read off the
+    grid at the spot, and calculate_greeks returns all four at the cost of one pricing."""
+
+    _results = ("greeks", )
+
+    def __init__(self, space_steps, time_steps, pricer, width = 5.0, rannacher_steps = 2):
+        self.__space_steps = space_steps
+        self.__time_steps = time_steps
+        self.__pricer = pricer
+        self.__width = width
+        self.__rannacher_steps = rannacher_steps
+        self.__greeks = None
+
+    @property
+    def space_steps(self):
+        return self.__space_steps
+
+    @space_steps.setter
+    def space_steps(self, new_space_steps):
+        self.__space_steps = new_space_steps
+
+    @property
+    def time_steps(self):
+        return self.__time_steps
+
+    @time_steps.setter
+    def time_steps(self, new_time_steps):
+        self.__time_steps = new_time_steps
+
+    @property
+    def width(self):
+        return self.__width
+
+    @property
+    def rannacher_steps(self):
+        return self.__rannacher_steps
+
+    @property
+    def greeks(self):
+        """Price, delta, gamma and theta from the last grid solved."""
+        return self.__greeks
+
+    @greeks.setter
+    def greeks(self, new_greeks):
+        self.__greeks = new_greeks
+
+    def calculate(self, option, data, result = False):
+        start = time.perf_counter()
+        return _finish(self.__pricer(self, option, data), start, result)
+
+    def calculate_greeks(self, option, data):
+        self.__pricer(self, option, data)
+        return self.__greeks
+
+
+def CrankNicolsonGrid(engine, option, data, american = False):
+    """Roll the payoff back from expiry on the log-spot grid.  American exercise is imposed by
+    the penalty method: each step re-solves with a large penalty on the nodes where the value
+    falls below the payoff until that set stops changing.  Returns (spots, values, previous),
+    the grid, the values today and the values one time step later."""
+    from scipy.linalg import solve_banded
+    expiry = option.expiry
+    (spot, rate, volatility, dividend) = MarketInputs(data, option)
+    half = max(int(engine.space_steps) // 2, 2)
+    time_steps = int(engine.time_steps)
+    delta_t = expiry / time_steps
+
+    width = max(engine.width * volatility * np.sqrt(expiry), 1.5 * abs(np.log(option.strike / spot)))
+    dx = width / half
+    spots = spot * np.exp(dx * np.arange(-half, half + 1))
+    nodes = spots.shape[0]
+
+    nu = rate - dividend - 0.5 * volatility * volatility
+    diffusion = 0.5 * volatility * volatility / (dx * dx)
+    lower = diffusion - 0.5 * nu / dx
+    upper = diffusion + 0.5 * nu / dx
+    centre = -2.0 * diffusion - rate
+
+    def banded(theta):
+        ab = np.zeros((3, nodes))
+        ab[0, 2:] = -theta * delta_t * upper
+        ab[1, 1:-1] = 1.0 - theta * delta_t * centre
+        ab[2, :-2] = -theta * delta_t * lower
+        ab[1, 0] = ab[1, -1] = 1.0
+        return ab
+
+    payoff = option.payoff(spots)
+    edges = spots[[0, -1]]
+    values = payoff.astype(np.float64)
+    previous = values
+    penalty = 1e8
+    for n in range(time_steps):
+        theta = 1.0 if n < engine.rannacher_steps else 0.5
+        ab = banded(theta)
+        tau = (n + 1) * delta_t
+        rhs = values.copy()
+        rhs[1:-1] += (1.0 - theta) * delta_t * (lower * values[:-2] + centre * values[1:-1] + upper * values[2:])
+        rhs[[0, -1]] = np.exp(-rate * tau) * option.payoff(edges * np.exp((rate - dividend) * tau))
+        if american:
+            rhs[[0, -1]] = np.maximum(rhs[[0, -1]], payoff[[0, -1]])
+        previous = values
+        values = solve_banded((1, 1), ab, rhs)
+        if american:
+            active = np.zeros(nodes, dtype = bool)
+            for iteration in range(50):
+                now_active = values < payoff
+                now_active[[0, -1]] = False
+                if iteration > 0 and np.array_equal(now_active, active):
+                    break
+                active = now_active
+                penalised = ab.copy()
+                penalised[1, active] += penalty
+                values = solve_banded((1, 1), penalised, rhs + penalty * payoff * active)
+    return (spots, values, previous)
+
+
+def _grid_greeks(engine, spots, values, previous, delta_t):
+    """Price, delta, gamma and theta at the centre node of the log-spot grid."""
+    centre = spots.shape[0] // 2
+    dx = np.log(spots[centre + 1] / spots[centre])
+    spot = spots[centre]
+    v_x = (values[centre + 1] - values[centre - 1]) / (2.0 * dx)
+    v_xx = (values[centre + 1] - 2.0 * values[centre] + values[centre - 1]) / (dx * dx)
+    engine.greeks = {
+        "price": values[centre],
+        "delta": v_x / spot,
+        "gamma": (v_xx - v_x) / (spot * spot),
+        "theta": (previous[centre] - values[centre]) / delta_t,
+    }
+    return values[centre]
+
+
+def EuropeanFiniteDifferencePricer(engine, option, data):
+    (spots, values, previous) = CrankNicolsonGrid(engine, option, data, american = False)
+    return _grid_greeks(engine, spots, values, previous, option.expiry / int(engine.time_steps))
+
+
+def AmericanFiniteDifferencePricer(engine, option, data):
+    (spots, values, previous) = CrankNicolsonGrid(engine, option, data, american = True)
+    return _grid_greeks(engine, spots, values, previous, option.expiry / int(engine.time_steps))
+
+
+class RunningStatistics(object):
+    """Online mean and (co)variance of Monte Carlo samples.  Each chunk of samples is reduced to
+    its count, mean and centred second moment, then merged into the running totals with the
+    pairwise update of Chan, Golub and LeVeque (Welford's update for a chunk of one), so memory
+    never grows with the number of samples.  Samples may be a (n, ) vector or a (n, k) matrix of
+    k jointly simulated quantities, in which case the co-moments are tracked as well."""
+
+    def __init__(self):
+        self.__count = 0
+        self.__mean = 0.0
+        self.__m2 = 0.0
+
+    @property
+    def count(self):
+        return self.__count
+
+    @property
+    def mean(self):
+        return self.__mean
+
+    @property
+    def covariance(self):
+        return self.__m2 / (self.__count - 1)
+
+    @property
+    def variance(self):
+        covariance = self.covariance
+        return np.diagonal(covariance) if np.ndim(covariance) == 2 else covariance
+
+    @property
+    def std_error(self):
+        return np.sqrt(self.variance / self.__count)
+
+    def update(self, samples):
+        samples = np.asarray(samples, dtype = np.float64)
+        if samples.shape[0] == 0:
+            return self
+        mean = samples.mean(axis = 0)
+        centered = samples - mean
+        self.__merge(samples.shape[0], mean, np.dot(centered.T, centered))
+        return self
+
+    def merge(self, other):
+        if other.__count > 0:
+            self.__merge(other.__count, other.__mean, other.__m2)
+        return self
+
+    def __merge(self, count, mean, m2):
+        total = self.__count + count
+        delta = mean - self.__mean
+        self.__mean = self.__mean + delta * (count / total)
+        self.__m2 = self.__m2 + m2 + np.multiply.outer(delta, delta) * (self.__count * count / total)
+        self.__count = total
+
+
 class MonteCarloPricingEngine(PricingEngine):
-    def __init__(self, replications, time_steps, pricer):
+    """Monte Carlo engine.  Pricers hand the engine a sampler, a module level function
+    sampler(engine, option, data, rng, n) returning n discounted samples, which simulate runs
+    chunk by chunk, accumulating the statistics online.  A fixed seed makes every calculation
+    reproducible.  target_error and relative_tolerance stop a run at a precision, workers runs
+    it in parallel blocks, sequence switches to randomized quasi-Monte Carlo and sampling adds
+    SamplingLayer variance-reduction layers; simulate and its chunk helpers describe each."""
+
+    _results = ("replications_used", "statistics", "greeks", "date_streams")
+
+    def __init__(self, replications, time_steps, pricer, seed = None, chunk_size = None,
+                 target_error = None, relative_tolerance = None, max_replications = None, workers = None,
+                 sequence = None, randomizations = 16, sampling = ()):
         self.__replications = replications
         self.__time_steps = time_steps
         self.__pricer = pricer
+        self.__seed = seed
+        self.__chunk_size = chunk_size
+        self.__target_error = target_error
+        self.__relative_tolerance = relative_tolerance
+        self.__max_replications = max_replications
+        self.__workers = workers
+        self.__sequence = sequence
+        self.__randomizations = randomizations
+        self.__sampling = tuple(sampling)
+        self.__replications_used = 0
+        self.__statistics = None
+        self.__greeks = None
+        self.__date_streams = (None, ())
 
     @property
     def replications(self):
@@ -142,203 +716,1113 @@ class MonteCarloPricingEngine(PricingEngine):
     @time_steps.setter
     def time_steps(self, new_time_steps):
         self.__time_steps = new_time_steps
+
+    @property
+    def seed(self):
+        return self.__seed
+
+    @seed.setter
+    def seed(self, new_seed):
+        self.__seed = new_seed
+
+    @property
+    def chunk_size(self):
+        return self.__chunk_size
+
+    @chunk_size.setter
+    def chunk_size(self, new_chunk_size):
+        self.__chunk_size = new_chunk_size
+
+    @property
+    def target_error(self):
+        return self.__target_error
+
+    @target_error.setter
+    def target_error(self, new_target_error):
+        self.__target_error = new_target_error
+
+    @property
+    def relative_tolerance(self):
+        return self.__relative_tolerance
+
+    @relative_tolerance.setter
+    def relative_tolerance(self, new_relative_tolerance):
+        self.__relative_tolerance = new_relative_tolerance
+
+    @property
+    def max_replications(self):
+        return self.__max_replications
+
+    @max_replications.setter
+    def max_replications(self, new_max_replications):
+        self.__max_replications = new_max_replications
+
+    @property
+    def workers(self):
+        return self.__workers
+
+    @workers.setter
+    def workers(self, new_workers):
+        self.__workers = new_workers
+
+    @property
+    def sequence(self):
+        return self.__sequence
+
+    @sequence.setter
+    def sequence(self, new_sequence):
+        self.__sequence = new_sequence
+
+    @property
+    def randomizations(self):
+        return self.__randomizations
+
+    @randomizations.setter
+    def randomizations(self, new_randomizations):
+        self.__randomizations = new_randomizations
+
+    @property
+    def sampling(self):
+        return self.__sampling
+
+    @sampling.setter
+    def sampling(self, new_sampling):
+        self.__sampling = tuple(new_sampling)
+
+    @property
+    def replications_used(self):
+        return self.__replications_used
+
+    @property
+    def statistics(self):
+        return self.__statistics
+
+    @property
+    def greeks(self):
+        """PricingResults for price, delta, vega and gamma from the last run of a Greeks pricer
+        such as Pathwise_Greeks_Pricer, each with its own standard error."""
+        return self.__greeks
+
+    @greeks.setter
+    def greeks(self, new_greeks):
+        self.__greeks = new_greeks
+
+    def calculate_greeks(self, option, data):
+        self.__pricer(self, option, data)
+        return self.__greeks
     
-    def calculate(self, option, data):
-        return self.__pricer(self, option, data)     
-        
-def Naive_Monte_Carlo_Pricer(engine, option, data):
-    expiry = option.expiry
-    strike = option.strike
-    (spot, rate, volatility, dividend) = data.get_data()
-    time_steps = engine.time_steps
-    replications = engine.replications
-    discount_rate = np.exp(-rate * expiry)
-    delta_t = expiry
-    z = np.random.normal(size = replications)
-    
-    nudt = (rate - dividend - 0.5 * volatility * volatility) * expiry
-    sidt = volatility * np.sqrt(expiry)
-    
-    spot_t = np.zeros((replications, ))
-    payoff_t = np.zeros((replications, ))
-    spot_t = spot * np.exp(nudt + sidt * z)
-        
-    payoff_t = option.payoff(spot_t)
-    
-    #title("Naive Monte Carlo")
-    #hist(spot_t, bins=50)
-    standard_error = payoff_t.std() / np.sqrt(replications)
-    price = discount_rate * payoff_t.mean()
-    print("The standard error for Naive Monte Carlo is: {}".format(standard_error))
-    
-    return price
-    
-def Stratified_Monte_Carlo_Pricer(engine, option, data):
-    expiry = option.expiry
-    strike = option.strike
-    (spot, rate, volatility, dividend) = data.get_data()
-    time_steps = engine.time_steps
-    replications = engine.replications
-    discount_rate = np.exp(-rate * expiry)
-    delta_t = expiry 
-    
-    nudt = (rate - 0.5 * volatility * volatility) * delta_t
+    def calculate(self, option, data, result = False):
+        start = time.perf_counter()
+        return _finish(self.__pricer(self, option, data), start, result)
+
+    def calculate_scenarios(self, option, scenarios):
+        """Prices of a terminal payoff option on each MarketData in scenarios from one set of
+        terminal normals shared by all of them.  Under GBM the terminal spot is exact given the
+        draw, so every scenario rescales the same draws instead of running a new simulation.
+        The plain Monte Carlo estimator is used whatever the engine's pricer."""
+        inputs = np.array([MarketInputs(data, option) for data in scenarios], dtype = np.float64)
+        (spot, rate, volatility, dividend) = (column[:, np.newaxis] for column in inputs.T)
+        drift = (rate - dividend - 0.5 * volatility * volatility) * option.expiry
+        diffusion = volatility * np.sqrt(option.expiry)
+        rng = np.random.default_rng(self.__seed)
+        replications = int(self.__replications)
+        chunk_size = int(self.__chunk_size or replications)
+        totals = np.zeros(len(scenarios))
+        done = 0
+        while done < replications:
+            n = min(chunk_size, replications - done)
+            spot_t = spot * np.exp(drift + diffusion * rng.standard_normal(n))
+            totals += option.payoff(spot_t, out = spot_t).sum(axis = 1)
+            done += n
+        return np.exp(-rate[:, 0] * option.expiry) * totals / replications
+
+    def simulate(self, sampler, option, data, estimator = None, sampling = ()):
+        """Run sampler chunk by chunk and return the RunningStatistics of the samples it
+        produced.  With target_error (an absolute standard error) or relative_tolerance (one
+        relative to the price) set, the run stops at the first chunk that meets the target, or
+        after max_replications paths (replications when None); replications_used keeps the
+        count.  Samplers that return several columns pass an estimator, statistics -> (price,
+        std_error, ...), which the target is checked against.  Pricers may add their own
+        sampling layers to the engine's."""
+        targeted = self.__target_error is not None or self.__relative_tolerance is not None
+        replications = int(self.__replications)
+        if targeted and self.__max_replications is not None:
+            replications = int(self.__max_replications)
+        layers = _sampling_layers(self.__sampling + tuple(sampling))
+        if self.__sequence is not None and layers:
+            raise ValueError("Sampling layers cannot be combined with a quasi-random sequence.")
+        if self.__sequence is not None:
+            chunks = self.__quasi_random_chunks(sampler, option, data, replications, layers)
+        elif self.__workers is None:
+            chunks = self.__serial_chunks(sampler, option, data, replications, layers)
+        else:
+            chunks = self.__parallel_chunks(sampler, option, data, replications, layers)
+
+        statistics = RunningStatistics()
+        done = 0
+        for (n, chunk_statistics) in chunks:
+            statistics.merge(chunk_statistics)
+            done += n
+            if targeted and statistics.count > 1 and self.__precision_reached(statistics, estimator):
+                chunks.close()
+                break
+        self.__replications_used = done
+        self.__statistics = statistics
+        return statistics
+
+    def __serial_chunks(self, sampler, option, data, replications, layers):
+        """Chunks of chunk_size paths (all replications when None) off one generator seeded
+        with seed, so a seeded run draws the same random numbers whatever the chunk size."""
+        rng = np.random.default_rng(self.__seed)
+        chunk_size = int(self.__chunk_size or self.__replications)
+        done = 0
+        while done < replications:
+            n = _granular(min(chunk_size, replications - done), layers)
+            yield (n, RunningStatistics().update(_sample_chunk(sampler, self, option, data, rng, n, layers)))
+            done += n
+
+    def __quasi_random_chunks(self, sampler, option, data, replications, layers):
+        """Randomized quasi-Monte Carlo for sequence "sobol" or "halton": replications are split
+        over `randomizations` independently scrambled copies of the sequence (rounded down to a
+        multiple of randomizations, with a warning; use powers of two per randomization for
+        Sobol), and multi-step paths are built by Brownian bridge.  Each randomization is
+        reduced to the mean of its samples, which becomes one sample of the statistics the
+        engine reports, so the standard error is that of the randomization means.  Runs
+        in-process and takes no sampling layers."""
+        randomizations = int(self.__randomizations)
+        points = replications // randomizations
+        if points < 1:
+            raise ValueError("Quasi-Monte Carlo needs at least one replication per randomization.")
+        if replications % randomizations:
+            warnings.warn("Quasi-Monte Carlo runs {0} replications, {1} per randomization, instead of {2}."
+                          .format(points * randomizations, points, replications))
+        chunk_size = int(self.__chunk_size or points)
+        for seed in np.random.SeedSequence(self.__seed).spawn(randomizations):
+            sequence = LowDiscrepancySequence(self.__sequence, seed)
+            randomization = RunningStatistics()
+            done = 0
+            while done < points:
+                n = _granular(min(chunk_size, points - done), layers)
+                randomization.update(_sample_chunk(sampler, self, option, data, sequence, n, layers))
+                done += n
+            yield (done, RunningStatistics().update(np.asarray(randomization.mean)[np.newaxis]))
+
+    def __parallel_chunks(self, sampler, option, data, replications, layers):
+        """Blocks of chunk_size paths (PARALLEL_BLOCK_SIZE when None), each on its own stream
+        spawned from SeedSequence(seed), run on a pool of workers and merged in block order, so
+        a seeded run gives the same result on any number of workers.  Blocks are submitted a
+        wave of workers at a time, so a precision-targeted run stops after the first block in
+        order that meets the target.  Samplers, options and market data must be picklable."""
+        block_size = int(self.__chunk_size or PARALLEL_BLOCK_SIZE)
+        sizes = [_granular(min(block_size, replications - start), layers)
+                 for start in range(0, replications, block_size)]
+        seeds = np.random.SeedSequence(self.__seed).spawn(len(sizes))
+        workers = int(self.__workers)
+        if workers == 1:
+            for (n, seed) in zip(sizes, seeds):
+                yield (n, _simulate_block(sampler, self, option, data, seed, n, layers))
+            return
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers = workers) as pool:
+            for wave in range(0, len(sizes), workers):
+                futures = [pool.submit(_simulate_block, sampler, self, option, data, seed, n, layers)
+                           for (n, seed) in zip(sizes[wave:wave + workers], seeds[wave:wave + workers])]
+                for (n, future) in zip(sizes[wave:wave + workers], futures):
+                    yield (n, future.result())
+
+    def __precision_reached(self, statistics, estimator):
+        if estimator is None:
+            (price, std_error) = (statistics.mean, statistics.std_error)
+        else:
+            (price, std_error) = estimator(statistics)[:2]
+        if self.__target_error is not None and std_error <= self.__target_error:
+            return True
+        if self.__relative_tolerance is not None and std_error <= self.__relative_tolerance * abs(price):
+            return True
+        return False
+
+    def paths(self, option, data, replications = None, time_steps = None, rng = np.random):
+        """Simulate a (replications, time_steps + 1) array of GBM paths out to option.expiry.
+        Defaults to the engine's replications and time_steps."""
+        if replications is None:
+            replications = self.__replications
+        if time_steps is None:
+            time_steps = self.__time_steps
+        (spot, rate, volatility, dividend) = MarketInputs(data, option)
+        z = rng.standard_normal(size = (replications, int(time_steps)))
+        return GeometricBrownianPaths(spot, rate, volatility, dividend, option.expiry, z)
+
+    def cache_key(self):
+        """Monte Carlo prices are only reproducible, and so only cached, under a fixed seed."""
+        if self.__seed is None:
+            return None
+        return super().cache_key()
+
+    def path_statistics(self, option, data, inputs = None, replications = None, time_steps = None,
+                        rng = np.random):
+        """The path statistics named in inputs (by default those the option's payoff declares),
+        accumulated along GBM paths without storing them.  Paths step to the option's fixing
+        dates when it has a schedule, otherwise time_steps equal steps as in paths.  A plain
+        numpy generator seeds one child stream per date the first time it is seen, and every
+        chunk drawn with it then takes its column for each date from that date's stream, so
+        memory is O(replications) and chunked runs draw the same numbers as one chunk.  The
+        sampling layers and low-discrepancy sequences need the whole (replications, dates)
+        block of normals at once."""
+        if inputs is None:
+            inputs = _payoff_inputs(option)
+        if replications is None:
+            replications = self.__replications
+        if time_steps is None:
+            time_steps = self.__time_steps
+        (spot, rate, volatility, dividend) = MarketInputs(data, option)
+        schedule = FixingSchedule(option, time_steps)
+        dates = schedule[0].shape[0]
+        if rng is np.random or isinstance(rng, (np.random.Generator, np.random.RandomState)):
+            (owner, streams) = self.__date_streams
+            if owner is not rng or len(streams) != dates:
+                entropy = rng.integers(2 ** 32) if hasattr(rng, "integers") else rng.randint(2 ** 32)
+                streams = [np.random.default_rng(child) for child in np.random.SeedSequence(entropy).spawn(dates)]
+                self.__date_streams = (rng, streams)
+            z = _DateNormals(streams, replications)
+        else:
+            z = rng.standard_normal(size = (replications, dates))
+        return PathStatistics(spot, rate, volatility, dividend, option.expiry, z, inputs, schedule = schedule)
+
+
+PARALLEL_BLOCK_SIZE = 65536
+
+
+class LowDiscrepancySequence(object):
+    """One scrambled randomization of a Sobol or Halton sequence, standing in for the numpy
+    Generator handed to samplers.  Each call to standard_normal or uniform returns the next
+    points of the sequence, so a sampler must draw the same dimension on every call.
+    Two-dimensional normal draws are treated as path increments and built by Brownian bridge."""
+
+    def __init__(self, kind, seed, bridge = True):
+        if kind not in ("sobol", "halton"):
+            raise ValueError("The sequence must be either 'sobol' or 'halton'.")
+        self.__kind = kind
+        self.__rng = np.random.default_rng(seed)
+        self.__bridge = bridge
+        self.__engine = None
+
+    def __points(self, n, dimension):
+        if self.__engine is None:
+            from scipy.stats import qmc
+            if self.__kind == "sobol":
+                self.__engine = qmc.Sobol(dimension, scramble = True, seed = self.__rng)
+            else:
+                self.__engine = qmc.Halton(dimension, scramble = True, seed = self.__rng)
+        elif self.__engine.d != dimension:
+            raise ValueError("A quasi-random sampler must draw the same dimension on every call.")
+        return self.__engine.random(n)
+
+    def uniform(self, size):
+        (n, dimension) = (size, 1) if np.ndim(size) == 0 else (size[0], int(np.prod(size[1:])))
+        return self.__points(n, dimension).reshape(size)
+
+    def standard_normal(self, size):
+        (n, dimension) = (size, 1) if np.ndim(size) == 0 else (size[0], int(np.prod(size[1:])))
+        from scipy.special import ndtri
+        u = np.clip(self.__points(n, dimension), 1e-16, 1.0 - 1e-16)
+        z = ndtri(u)
+        if self.__bridge and dimension > 1:
+            z = BrownianBridge(z)
+        return z.reshape(size)
+
+
+def BrownianBridge(z):
+    """Map (n, time_steps) independent standard normals, ordered from most to least important,
+    to (n, time_steps) standard normal increments of a Brownian path on an even grid.  The first
+    column fixes the terminal value and the rest fill in midpoints by bisection."""
+    (n, time_steps) = z.shape
+    w = np.zeros((n, time_steps + 1))
+    w[:, time_steps] = np.sqrt(time_steps) * z[:, 0]
+    intervals = [(0, time_steps)]
+    k = 1
+    for (left, right) in intervals:
+        if right - left < 2:
+            continue
+        mid = (left + right) // 2
+        width = right - left
+        w[:, mid] = (((right - mid) * w[:, left] + (mid - left) * w[:, right]) / width
+                     + np.sqrt((mid - left) * (right - mid) / width) * z[:, k])
+        k += 1
+        intervals.append((left, mid))
+        intervals.append((mid, right))
+    return np.diff(w, axis = 1)
+
+
+def _simulate_block(sampler, engine, option, data, seed, n, layers = ()):
+    """Worker side of the parallel mode: one block of n paths on its own random stream."""
+    rng = np.random.default_rng(seed)
+    return RunningStatistics().update(_sample_chunk(sampler, engine, option, data, rng, n, layers))
+
+
+def _sample_chunk(sampler, engine, option, data, rng, n, layers):
+    """Run sampler on one chunk, through the sampling layers if there are any, and average the
+    samples of each design so the rows handed back are independent."""
+    if not layers:
+        return sampler(engine, option, data, rng, n)
+    layered = LayeredGenerator(rng, layers)
+    samples = np.asarray(sampler(engine, option, data, layered, n), dtype = np.float64)
+    designs = layered.designs
+    if designs is None or designs.shape[0] != samples.shape[0]:
+        return samples
+    counts = np.bincount(designs)
+    if samples.ndim == 1:
+        return np.bincount(designs, weights = samples) / counts
+    return np.column_stack([np.bincount(designs, weights = column) / counts for column in samples.T])
+
+
+def _granular(n, layers):
+    granularity = 1
+    for layer in layers:
+        granularity *= layer.granularity
+    return -(-n // granularity) * granularity
+
+
+def _sampling_layers(layers):
+    """Check a stack of sampling layers is in the one order that composes: at most one source
+    layer (Stratified or LatinHypercube) first, then MomentMatched, then Antithetic."""
+    ranks = [layer.rank for layer in layers]
+    if ranks != sorted(ranks) or len(set(ranks)) != len(ranks):
+        raise ValueError("Sampling layers must be ordered source, MomentMatched, Antithetic, each at most once.")
+    return layers
+
+
+class SamplingLayer(object, metaclass=abc.ABCMeta):
+    """A variance-reduction layer for MonteCarloPricingEngine.  draw(rng, inner, n, dimension)
+    returns (z, designs): an (n, dimension) array of standard normal draws and, for each row,
+    the id of the design it belongs to.  inner is the draw of the layer below it, with the same
+    signature minus rng; the bottom of the stack is plain iid draws, one design per row."""
+    rank = 0
+    granularity = 1
+
+    @abc.abstractmethod
+    def draw(self, rng, inner, n, dimension):
+        pass
+
+
+def _iid_normals(rng, n, dimension):
+    return (rng.standard_normal(size = (n, dimension)), np.arange(n))
+
+
+def _design_positions(n, points):
+    """Design id, position within the design and design size for n rows cut into n // points
+    designs, but at least two so the design means have a spread.  The rows are shared out so
+    design sizes differ by at most one, keeping equally weighted design means comparable."""
+    count = max(n // points, min(n, 2), 1)
+    designs = np.arange(n) * count // n
+    counts = np.bincount(designs, minlength = count)
+    starts = np.cumsum(counts) - counts
+    return (designs, np.arange(n) - starts[designs], counts[designs])
+
+
+class Stratified(SamplingLayer):
+    """Stratifies the terminal value of the Brownian driver: designs of about `strata` rows each
+    take one draw from each of as many equiprobable strata of the first coordinate, and
+    multi-step draws are built by Brownian bridge so that coordinate fixes the terminal value.
+    Chunks of fewer than 2 * strata rows are cut into two designs."""
+    rank = 0
+
+    def __init__(self, strata = 256):
+        self.strata = strata
+
+    def draw(self, rng, inner, n, dimension):
+        from scipy.special import ndtri
+        (designs, position, sizes) = _design_positions(n, self.strata)
+        z = rng.standard_normal(size = (n, dimension))
+        z[:, 0] = ndtri((position + rng.uniform(size = n)) / sizes)
+        if dimension > 1:
+            z = BrownianBridge(z)
+        return (z, designs)
+
+
+class LatinHypercube(SamplingLayer):
+    """Latin hypercube designs of about `points` rows, and at least two designs a chunk: every
+    coordinate of a design takes one draw from each of as many equiprobable strata, in an
+    independent random order."""
+    rank = 0
+
+    def __init__(self, points = 256):
+        self.points = points
+
+    def draw(self, rng, inner, n, dimension):
+        from scipy.special import ndtri
+        (designs, position, sizes) = _design_positions(n, self.points)
+        keys = rng.uniform(size = (n, dimension)) + designs[:, np.newaxis]
+        order = np.argsort(keys, axis = 0, kind = "stable")
+        strata = np.empty((n, dimension))
+        np.put_along_axis(strata, order, position[:, np.newaxis].astype(np.float64), axis = 0)
+        u = (strata + rng.uniform(size = (n, dimension))) / sizes[:, np.newaxis]
+        return (ndtri(u), designs)
+
+
+class MomentMatched(SamplingLayer):
+    """Shifts and rescales the draws of each design of the source layer below, or over plain
+    draws each of at least two near-equal blocks of about `block` rows, so every coordinate has
+    sample mean 0 and second moment 1 within it.  Matching leaves an O(1 / design size) bias in
+    the design means, which more replications do not remove."""
+    rank = 1
+
+    def __init__(self, block = 256):
+        self.block = block
+
+    def draw(self, rng, inner, n, dimension):
+        (z, designs) = inner(n, dimension)
+        if n > 1 and np.bincount(designs).max() < 2:
+            (designs, position, sizes) = _design_positions(n, self.block)
+        counts = np.bincount(designs)[:, np.newaxis]
+        sums = np.zeros((counts.shape[0], dimension))
+        np.add.at(sums, designs, z)
+        z = z - (sums / counts)[designs]
+        squares = np.zeros((counts.shape[0], dimension))
+        np.add.at(squares, designs, z * z)
+        std = np.sqrt(squares / counts)
+        std[~(std > 0.0).all(axis = 1)] = 1.0
+        return (z / std[designs], designs)
+
+
+class Antithetic(SamplingLayer):
+    """Pairs every draw of the layer below with its negation; each pair (or each pair of
+    designs below) becomes one design."""
+    rank = 2
+    granularity = 2
+
+    def draw(self, rng, inner, n, dimension):
+        (z, designs) = inner(n // 2, dimension)
+        return (np.concatenate((z, -z)), np.concatenate((designs, designs)))
+
+
+class LayeredGenerator(object):
+    """Stands in for the generator handed to samplers and routes standard_normal draws through
+    the sampling layers, remembering the design id of each row of the last draw."""
+
+    def __init__(self, rng, layers):
+        self.__rng = rng
+        self.__layers = layers
+        self.designs = None
+
+    def uniform(self, size):
+        self.designs = None
+        return self.__rng.uniform(size = size)
+
+    def standard_normal(self, size):
+        (n, dimension) = (size, 1) if np.ndim(size) == 0 else (size[0], int(np.prod(size[1:])))
+        draw = lambda n, dimension: _iid_normals(self.__rng, n, dimension)
+        for layer in self.__layers:
+            draw = _bind_layer(layer, self.__rng, draw)
+        (z, self.designs) = draw(n, dimension)
+        return z.reshape(size)
+
+
+def _bind_layer(layer, rng, inner):
+    return lambda n, dimension: layer.draw(rng, inner, n, dimension)
+
+
+def GeometricBrownianPaths(spot, rate, volatility, dividend, expiry, z):
+    """Log-Euler GBM paths built in one vectorized pass from a (replications, time_steps) array
+    of standard normal draws.  Returns a (replications, time_steps + 1) array whose first column
+    is the initial spot and whose last column is the spot at expiry."""
+    (replications, time_steps) = z.shape
+    delta_t = expiry / time_steps
+    nudt = (rate - dividend - 0.5 * volatility * volatility) * delta_t
     sidt = volatility * np.sqrt(delta_t)
-    
-    spot_t = np.zeros((replications, ))
-    payoff_t = np.zeros((replications, ))
-    
-    """stratified portion"""
-    for i in range(replications):
-        u = np.random.uniform(size = 1)
-        u_hat = (i + u) / replications
-        z = norm.ppf(u_hat)
-        spot_t[i] = spot * np.exp(nudt + sidt * z)
-        payoff_t[i] = option.payoff(spot_t[i])
-        
-    price = discount_rate * payoff_t.mean()
-    #title("Stratified Monte Carlo")
-    #hist(spot_t, bins=50)
-    standard_error = payoff_t.std(dtype = np.float64) / np.sqrt(replications)
-    print("Standard error for the stratified Monte Carlo Call is: {0:3f}".format(standard_error))
 
-    
-    return price
-    
-def Antithetic_Monte_Carlo_Pricer(engine, option, data):
+    paths = np.empty((replications, time_steps + 1))
+    paths[:, 0] = 0.0
+    np.cumsum(nudt + sidt * z, axis = 1, out = paths[:, 1:])
+    np.exp(paths, out = paths)
+    paths *= spot
+    return paths
+
+
+def _payoff_inputs(option):
+    return getattr(option, "inputs", (TERMINAL, ))
+
+
+def FixingSchedule(option, time_steps):
+    """(times, fixing, today): the dates a path is simulated to, a mask of those that are
+    averaging fixings (None when all are) and whether today's spot is a fixing.  Options with
+    fixings step to each fixing date and to expiry; others take time_steps equal steps."""
     expiry = option.expiry
-    strike = option.strike
-    (spot, rate, volatility, dividend) = data.get_data()   
-    time_steps = engine.time_steps
-    replications = engine.replications
-    discount_rate = np.exp(-rate * expiry)
-    delta_t = expiry 
-    z = np.random.normal(size = replications)
-    z = np.concatenate((z, -z))
+    fixings = getattr(option, "fixings", None)
+    if fixings is None:
+        time_steps = int(time_steps)
+        return (expiry * np.arange(1, time_steps + 1) / time_steps, None, False)
+    fixings = np.asarray(fixings, dtype = np.float64)
+    if np.any(fixings < 0.0) or np.any(fixings > expiry):
+        raise ValueError("Fixing dates must lie between today and expiry.")
+    times = np.union1d(fixings[fixings > 0.0], [expiry])
+    return (times, np.isin(times, fixings), bool(np.any(fixings == 0.0)))
 
-    nudt = (rate - 0.5 * volatility * volatility) * delta_t
-    sidt = volatility * np.sqrt(delta_t)    
-    
-    spot_t_antithetic = np.zeros((replications, ))
-    payoff_t_antithetic = np.zeros((replications, ))
-    for i in range(replications):
-        spot_t_antithetic[i] = spot * np.exp(nudt + sidt * z[i])
-        payoff_t_antithetic[i] = option.payoff(spot_t_antithetic[i])
+
+class _DateNormals(object):
+    """Stands in for the (replications, dates) array of normals PathStatistics reads, drawing
+    column k from the k-th of streams when z[:, k] is read.  Each column can be read once, in
+    date order."""
+
+    def __init__(self, streams, replications):
+        self.__streams = streams
+        self.__next = 0
+        self.shape = (replications, len(streams))
+
+    def __getitem__(self, index):
+        (rows, date) = index
+        if rows != slice(None) or date != self.__next:
+            raise IndexError("Date normals must be read as z[:, k], once each and in date order.")
+        self.__next += 1
+        return self.__streams[date].standard_normal(size = self.shape[0])
+
+
+def PathStatistics(spot, rate, volatility, dividend, expiry, z, inputs, vega = False, schedule = None):
+    """Statistics of GBM paths driven by a (replications, dates) array of normals, in the order
+    named by inputs: the spot at expiry, the arithmetic or geometric average over the fixing
+    dates, or the maximum or minimum over today and every date.  The dates come from schedule,
+    a FixingSchedule, and default to equal steps to expiry.  Paths are advanced one date at a
+    time (exactly, in log space) into O(replications) buffers, reading column k of z at date
+    k, so z may also be a _DateNormals that draws the columns as they are needed.  With vega
+    the pathwise derivatives of the statistics in volatility are accumulated alongside, from
+    dS_t / dvolatility = S_t (W_t - volatility t), and (statistics, derivatives) is returned."""
+    (replications, dates) = z.shape
+    if schedule is None:
+        schedule = (expiry * np.arange(1, dates + 1) / dates, None, False)
+    (times, fixing, today) = schedule
+    drift = rate - dividend - 0.5 * volatility * volatility
+    step = np.diff(times, prepend = 0.0)
+    nudt = drift * step
+    sidt = volatility * np.sqrt(step)
+    count = (dates if fixing is None else int(np.count_nonzero(fixing))) + today
+    wanted = set(inputs)
+
+    log_spot = np.zeros(replications)
+    relative = np.ones(replications)
+    totals = {name: np.ones(replications) for name in wanted & {MAXIMUM, MINIMUM}}
+    if AVERAGE in wanted:
+        totals[AVERAGE] = np.full(replications, 1.0 if today else 0.0)
+    log_total = np.zeros(replications) if GEOMETRIC_AVERAGE in wanted else None
+    if vega:
+        tangent = np.zeros(replications)
+        tangents = {name: np.zeros(replications) for name in wanted}
+    for k in range(dates):
+        log_spot += nudt[k] + sidt[k] * z[:, k]
+        if wanted == {TERMINAL} and k < dates - 1:
+            continue
+        fixed = fixing is None or fixing[k]
+        np.exp(log_spot, out = relative)
+        if vega:
+            t = times[k]
+            """d log S_t / dvolatility = W_t - volatility t, with W_t recovered from log S_t."""
+            np.subtract(log_spot, drift * t, out = tangent)
+            tangent /= volatility
+            tangent -= volatility * t
+            if GEOMETRIC_AVERAGE in tangents and fixed:
+                tangents[GEOMETRIC_AVERAGE] += tangent
+            tangent *= relative
+            if AVERAGE in tangents and fixed:
+                tangents[AVERAGE] += tangent
+            if MAXIMUM in tangents:
+                np.copyto(tangents[MAXIMUM], tangent, where = relative > totals[MAXIMUM])
+            if MINIMUM in tangents:
+                np.copyto(tangents[MINIMUM], tangent, where = relative < totals[MINIMUM])
+        if AVERAGE in totals and fixed:
+            totals[AVERAGE] += relative
+        if MAXIMUM in totals:
+            np.maximum(totals[MAXIMUM], relative, out = totals[MAXIMUM])
+        if MINIMUM in totals:
+            np.minimum(totals[MINIMUM], relative, out = totals[MINIMUM])
+        if log_total is not None and fixed:
+            log_total += log_spot
+
+    if AVERAGE in totals:
+        totals[AVERAGE] /= count
+    if log_total is not None:
+        log_total /= count
+        totals[GEOMETRIC_AVERAGE] = np.exp(log_total, out = log_total)
+    totals[TERMINAL] = relative
+    statistics = []
+    for name in inputs:
+        values = totals[name]
+        values *= spot
+        statistics.append(values)
+    if not vega:
+        return tuple(statistics)
+
+    if TERMINAL in tangents:
+        tangents[TERMINAL] = tangent
+    if AVERAGE in tangents:
+        tangents[AVERAGE] /= count
+    if GEOMETRIC_AVERAGE in tangents:
+        tangents[GEOMETRIC_AVERAGE] /= count
+        tangents[GEOMETRIC_AVERAGE] *= totals[GEOMETRIC_AVERAGE]
+    derivatives = []
+    for name in inputs:
+        values = tangents[name]
+        if name != GEOMETRIC_AVERAGE:
+            values *= spot
+        derivatives.append(values)
+    return (tuple(statistics), tuple(derivatives))
+
+
+def _naive_samples(engine, option, data, rng, n):
+    (spot, rate, volatility, dividend) = MarketInputs(data, option)
+    discount_rate = np.exp(-rate * option.expiry)
+    (spot_t, ) = engine.path_statistics(option, data, (TERMINAL, ), n, 1, rng)
+    samples = option.payoff(spot_t, out = spot_t)
+    samples *= discount_rate
+    return samples
+
+def Naive_Monte_Carlo_Pricer(engine, option, data):
+    statistics = engine.simulate(_naive_samples, option, data)
+    return PricingResult.from_estimate(statistics.mean, statistics.std_error, engine.replications_used)
     
-    price = discount_rate * payoff_t_antithetic.mean()
-    stderr = payoff_t_antithetic.std() / np.sqrt(replications)
-    #title("Antithetic Monte Carlo")
-    #hist(spot_t_antithetic, bins=50)
-    print("The standard error for Antithetic Monte Carlo is: {}".format(stderr))
+def Stratified_Monte_Carlo_Pricer(engine, option, data):
+    """Naive Monte Carlo with the terminal draw stratified through the Stratified sampling layer."""
+    statistics = engine.simulate(_naive_samples, option, data, sampling = (Stratified(), ))
+    return PricingResult.from_estimate(statistics.mean, statistics.std_error, engine.replications_used)
     
-    return price
+def Antithetic_Monte_Carlo_Pricer(engine, option, data):
+    """Naive Monte Carlo through the Antithetic sampling layer; replications counts both halves
+    of each pair, and the standard error is that of the pair averages."""
+    statistics = engine.simulate(_naive_samples, option, data, sampling = (Antithetic(), ))
+    return PricingResult.from_estimate(statistics.mean, statistics.std_error, engine.replications_used)
 
 def BlackScholesDelta(spot, t, strike, expiry, volatility, rate, dividend):
+    from scipy.special import ndtr
     tau = expiry - t
     d1 = (np.log(spot/strike) + (rate - dividend + 0.5 * volatility * volatility) * tau) / (volatility * np.sqrt(tau))
-    BS_delta = np.exp(-dividend * tau) * norm.cdf(d1) 
+    BS_delta = np.exp(-dividend * tau) * ndtr(d1) 
     return BS_delta
     
-def ControlVariatePricer(engine, option, data):
+def _control_variate_samples(engine, option, data, rng, n):
+    """Discounted payoff next to two discounted delta-hedge controls, both with mean zero: BS call
+    delta at each path spot times each step's hedging error, and the same with the delta of the
+    forward, e^(-q tau).  Together they span the put hedge as well as the call hedge."""
     expiry = option.expiry
     strike = option.strike
-    (spot, rate, volatility, dividend) = data.get_data()
-    time_steps = engine.time_steps
-    replications = engine.replications
+    (spot, rate, volatility, dividend) = MarketInputs(data, option)
+    time_steps = int(engine.time_steps)
     delta_t = expiry / time_steps    
-    nudt = (rate - dividend - 0.5 * volatility * volatility) * delta_t
-    sigsdt = volatility * np.sqrt(delta_t)
     erddt = np.exp((rate - dividend) * delta_t)    
-    beta = -1.0
-    cash_flow_t = np.zeros((replications, ))
-    price = 0.0
-
-    for j in range(replications):
-        spot_t = spot
-        convar = 0.0
-        z = np.random.normal(size = replications)
-
-        for i in range(int(time_steps)):
-            t = i * delta_t
-            BS_delta = BlackScholesDelta(spot, t, strike, expiry, volatility, rate, dividend)
-            spot_tn = spot_t * np.exp(nudt + sigsdt * z[i])
-            convar = convar + BS_delta * (spot_tn - spot_t * erddt)
-            spot_t = spot_tn
-
-        cash_flow_t[j] = option.payoff(spot_t) + beta * convar
-
-    title("Control Variate Monte Carlo")
-    hist(cash_flow_t, bins=50)
-    price = np.exp(-rate * expiry) * cash_flow_t.mean()
-    stderr = cash_flow_t.std() / np.sqrt(replications)
-    print("The standard error for Control Variate Monte Carlo is: {}".format(stderr))
-    return price
+    discount_rate = np.exp(-rate * expiry)
+
+    paths = engine.paths(option, data, n, time_steps, rng)
+    t = np.arange(time_steps) * delta_t
+    hedge_error = paths[:, 1:] - paths[:, :-1] * erddt
+    BS_delta = BlackScholesDelta(paths[:, :-1], t, strike, expiry, volatility, rate, dividend)
+
+    samples = np.empty((n, 3))
+    samples[:, 0] = discount_rate * option.payoff(paths[:, -1])
+    samples[:, 1] = discount_rate * np.einsum("ij,ij->i", BS_delta, hedge_error)
+    samples[:, 2] = discount_rate * np.dot(hedge_error, np.exp(-dividend * (expiry - t)))
+    return samples
+
+def ControlVariateEstimate(statistics, control_mean = 0.0):
+    """Regression control-variate estimate from RunningStatistics of (target, control, ...)
+    samples.  Uses the sample-optimal beta = cov(control)^-1 cov(control, target) and returns
+    (price, std_error, variance_reduction)."""
+    covariance = statistics.covariance
+    mean = statistics.mean
+    beta = np.linalg.solve(covariance[1:, 1:], covariance[1:, 0])
+    price = mean[0] - np.dot(beta, mean[1:] - control_mean)
+    variance = covariance[0, 0] - np.dot(beta, covariance[1:, 0])
+    std_error = np.sqrt(variance / statistics.count)
+    return (price, std_error, covariance[0, 0] / variance)
+
+def ControlVariatePricer(engine, option, data):
+    statistics = engine.simulate(_control_variate_samples, option, data, ControlVariateEstimate)
+    (price, std_error, variance_reduction) = ControlVariateEstimate(statistics)
+    return PricingResult.from_estimate(price, std_error, engine.replications_used,
+                                       variance_reduction = variance_reduction)
 
 
 def GeometricAsian(spot, volatility, strike, rate, expiry, time_steps):
-    vol_hat = volatility * np.sqrt((2.0 * time_steps + 1.0) / (6.0 * (time_steps + 1)))
-    rho = 0.5 * (rate - 0.5 *(volatility * volatility) + vol_hat * vol_hat)
-    d1 = (np.log(spot / strike) + (rho + 0.5 *vol_hat * vol_hat) * expiry) / (vol_hat * np.sqrt(expiry))
-    d2 = d1 - volatility * np.sqrt(expiry)
-    G_Asian = np.exp(-rate * expiry) * (spot * np.exp(rho * expiry) * norm.cdf(d1) - strike * norm.cdf(d2))
-    return G_Asian
-  
+    """Fixed-strike geometric Asian call averaging today's spot and time_steps equally spaced
+    dates to expiry."""
+    return DiscreteGeometricAsian(spot, strike, rate, volatility, 0.0, expiry,
+                                  np.linspace(0.0, expiry, int(time_steps) + 1))
+
+
+def DiscreteGeometricAsian(spot, strike, rate, volatility, dividend, expiry, fixings, is_call = True,
+                           floating = False):
+    """Closed-form price of a geometric-average Asian on the given fixing dates.  log G is
+    normal with mean log spot + (rate - dividend - volatility^2 / 2) mean(t) and variance
+    volatility^2 sum_ij min(t_i, t_j) / m^2; the fixed strike prices as Black-Scholes on G,
+    the floating strike as an exchange of S_T against G."""
+    from scipy.special import ndtr
+    fixings = np.sort(np.asarray(fixings, dtype = np.float64))
+    m = fixings.shape[0]
+    mean_time = fixings.mean()
+    variance_g = volatility * volatility * np.dot(fixings, 2.0 * (m - np.arange(m)) - 1.0) / (m * m)
+    forward_g = spot * np.exp((rate - dividend - 0.5 * volatility * volatility) * mean_time + 0.5 * variance_g)
+    if floating:
+        (high, low) = (spot * np.exp((rate - dividend) * expiry), forward_g)
+        variance = volatility * volatility * (expiry - 2.0 * mean_time) + variance_g
+    else:
+        (high, low) = (forward_g, strike)
+        variance = variance_g
+    if not is_call:
+        (high, low) = (low, high)
+    deviation = np.sqrt(variance)
+    d1 = (np.log(high / low) + 0.5 * variance) / deviation
+    d2 = d1 - deviation
+    return np.exp(-rate * expiry) * (high * ndtr(d1) - low * ndtr(d2))
+
+
+def _asian_samples(engine, option, data, rng, n):
+    """Discounted arithmetic-average payoff next to the same payoff on the geometric average."""
+    (spot, rate, volatility, dividend) = MarketInputs(data, option)
+    discount_rate = np.exp(-rate * option.expiry)
+    inputs = _payoff_inputs(option)
+    statistics = engine.path_statistics(option, data, inputs + (GEOMETRIC_AVERAGE, ), n, engine.time_steps, rng)
+    geometric = [statistics[-1] if name == AVERAGE else value for (name, value) in zip(inputs, statistics)]
+    samples = np.empty((n, 2))
+    option.payoff(*geometric, out = samples[:, 1])
+    option.payoff(*statistics[:-1], out = samples[:, 0])
+    samples *= discount_rate
+    return samples
+
+ASIAN_PAYOFFS = {arithmetic_asian_call_payoff: (True, False),
+                 arithmetic_asian_put_payoff: (False, False),
+                 floating_strike_asian_call_payoff: (True, True),
+                 floating_strike_asian_put_payoff: (False, True)}
+
+
+def _asian_terms(option):
+    """(is_call, floating) for an AsianPayoff or an ExoticPayoff on one of the ASIAN_PAYOFFS,
+    None for any other option."""
+    if hasattr(option, "floating"):
+        return (option.payoff_type == "call", option.floating)
+    return ASIAN_PAYOFFS.get(getattr(option, "payoff_function", None))
+
 
 def Asian_Option_Pricer(engine, option, data):
-    expiry = option.expiry
-    strike = option.strike
-    (spot, rate, volatility, dividend) = data.get_data()
-    time_steps = engine.time_steps
-    replications = engine.replications
-    discount_rate = np.exp(-rate * expiry)
-    delta_t = expiry / time_steps
-    z = np.random.normal(size = (replications, ))
-    nudt = (rate - 0.5 * volatility * volatility) * delta_t
-    sidt = volatility * np.sqrt(delta_t)    
-
-    """Path Dependent Portion"""
-    expected_return = rate - 0.5 * (volatility * volatility)
-    deterministic = np.matlib.repmat(expected_return * delta_t * time_steps, time_steps, 1)
-    stochastic = volatility * np.sqrt(delta_t) * np.cumsum(z)
-    spots = np.matlib.repmat(spot, 1, replications)
-    sim_paths = spots * np.exp(deterministic + stochastic)
-
-    spot_t = np.mean(sim_paths, 1)
-    payoff_t = discount_rate * option.payoff(spot_t)
-    convar = GeometricAsian(spot, volatility, strike, rate, expiry, time_steps)
-    G_average = np.exp((1/(time_steps +1)) * np.sum(np.log(sim_paths),1))
-    payoff_gavg = discount_rate * np.maximum(G_average - strike, 0)
-    convar_price = payoff_t + convar - payoff_gavg
-
-    price = np.mean(convar_price)
-    stderr = np.std(convar_price)
-    title("Geometric Asian Control Variate -- Arithmetic Asian Monte Carlo")    
-    hist(z, bins=50)
-
-    print("The standard error for Control Variate Monte Carlo simulation for an Arithmetic Asian Call option is: {}".format(stderr))
-    
-    return price
+    """Arithmetic Asian, an AsianPayoff (call or put, fixed or floating strike) or an
+    ExoticPayoff on one of the ASIAN_PAYOFFS, on its fixing schedule, with the closed-form
+    geometric Asian as a control variate whose beta is estimated by regression on the same
+    paths.  Other path payoffs are priced without the control."""
+    terms = _asian_terms(option)
+    if terms is None:
+        return Path_Monte_Carlo_Pricer(engine, option, data)
+    (is_call, floating) = terms
+    (spot, rate, volatility, dividend) = MarketInputs(data, option)
+    (times, fixing, today) = FixingSchedule(option, engine.time_steps)
+    fixings = times if fixing is None else times[fixing]
+    if today:
+        fixings = np.append(0.0, fixings)
+    control_mean = DiscreteGeometricAsian(spot, option.strike, rate, volatility, dividend, option.expiry,
+                                          fixings, is_call, floating)
+    estimator = functools.partial(ControlVariateEstimate, control_mean = control_mean)
+    statistics = engine.simulate(_asian_samples, option, data, estimator)
+    (price, std_error, variance_reduction) = estimator(statistics)
+    return PricingResult.from_estimate(price, std_error, engine.replications_used,
+                                       variance_reduction = variance_reduction)
     
     
+def _lookback_samples(engine, option, data, rng, n):
+    (spot, rate, volatility, dividend) = MarketInputs(data, option)
+    discount_rate = np.exp(-rate * option.expiry)
+    (spot_max, ) = engine.path_statistics(option, data, (MAXIMUM, ), n, engine.time_steps, rng)
+    samples = option.payoff(spot_max, out = spot_max)
+    samples *= discount_rate
+    return samples
+
 def Lookback_Option_Pricer(engine, option, data):
+    """Fixed-strike lookback: the payoff is applied to the running maximum of each path."""
+    statistics = engine.simulate(_lookback_samples, option, data)
+    return PricingResult.from_estimate(statistics.mean, statistics.std_error, engine.replications_used)
+
+
+MONTE_CARLO_GREEKS = ("price", "delta", "vega", "gamma")
+
+
+def _payoff_gradient(option, statistics):
+    """Partial derivatives of the payoff in each of its input statistics, by central differences
+    with a relative step; kinks are crossed on a set of paths of vanishing measure."""
+    gradient = []
+    for i in range(len(statistics)):
+        step = 1e-6 * np.maximum(np.abs(statistics[i]), 1e-3)
+        up = list(statistics)
+        down = list(statistics)
+        up[i] = statistics[i] + step
+        down[i] = statistics[i] - step
+        gradient.append((option.payoff(*up) - option.payoff(*down)) / (2.0 * step))
+    return gradient
+
+
+def _pathwise_greek_samples(engine, option, data, rng, n):
+    """Discounted payoff, pathwise delta and vega and a likelihood-ratio-pathwise gamma.  The
+    statistics are proportional to spot, so their spot derivative is statistic / spot; gamma
+    differentiates the pathwise delta through the score of the first increment."""
+    (spot, rate, volatility, dividend) = MarketInputs(data, option)
     expiry = option.expiry
-    strike = option.strike
-    (spot, rate, volatility, dividend) = data.get_data()
-    steps = engine.steps
+    schedule = FixingSchedule(option, engine.time_steps)
     discount_rate = np.exp(-rate * expiry)
-    delta_t = expiry
-    z = np.random.normal(size = steps)
-    
-    nudt = (rate - 0.5 * volatility * volatility) * delta_t
-    sidt = volatility * np.sqrt(delta_t)    
-    
-    spot_t = np.zeros((steps, ))
-    payoff_t = np.zeros((steps, ))
-    
-    for i in range(steps):
-        spot_t[i] = spot * nudt + sidt * z[i]
-        payoff_t[i] = option.payoff(spot_t[i])
-        
-    price = discount_rate * payoff_t.max()   
-    
-    return price
+    z = rng.standard_normal(size = (n, schedule[0].shape[0]))
+    (statistics, vegas) = PathStatistics(spot, rate, volatility, dividend, expiry, z,
+                                         _payoff_inputs(option), vega = True, schedule = schedule)
+    gradient = _payoff_gradient(option, statistics)
+    samples = np.empty((n, 4))
+    samples[:, 0] = discount_rate * option.payoff(*statistics)
+    spot_terms = sum(g * x for (g, x) in zip(gradient, statistics))
+    samples[:, 1] = discount_rate / spot * spot_terms
+    samples[:, 2] = discount_rate * sum(g * v for (g, v) in zip(gradient, vegas))
+    samples[:, 3] = samples[:, 1] / spot * (z[:, 0] / (volatility * np.sqrt(schedule[0][0])) - 1.0)
+    return samples
+
+def _likelihood_ratio_greek_samples(engine, option, data, rng, n):
+    """Discounted payoff times the likelihood-ratio scores of the path density: delta and gamma
+    through the first increment, vega through every increment.  No payoff derivative is
+    needed, so digital payoffs are covered, but the variance grows with time_steps."""
+    (spot, rate, volatility, dividend) = MarketInputs(data, option)
+    expiry = option.expiry
+    schedule = FixingSchedule(option, engine.time_steps)
+    discount_rate = np.exp(-rate * expiry)
+    sqrt_dt = np.sqrt(np.diff(schedule[0], prepend = 0.0))
+    z = rng.standard_normal(size = (n, sqrt_dt.shape[0]))
+    statistics = PathStatistics(spot, rate, volatility, dividend, expiry, z, _payoff_inputs(option),
+                                schedule = schedule)
+    first = z[:, 0]
+    sidt = volatility * sqrt_dt[0]
+    samples = np.empty((n, 4))
+    samples[:, 0] = discount_rate * option.payoff(*statistics)
+    samples[:, 1] = samples[:, 0] * first / (spot * sidt)
+    samples[:, 2] = samples[:, 0] * ((z * z - 1.0) / volatility - z * sqrt_dt).sum(axis = 1)
+    samples[:, 3] = samples[:, 0] * (first * first - 1.0 - first * sidt) / (spot * spot * sidt * sidt)
+    return samples
+
+def _price_column(statistics):
+    return (statistics.mean[0], statistics.std_error[0])
+
+def _greeks_result(engine, option, data, sampler):
+    statistics = engine.simulate(sampler, option, data, _price_column)
+    engine.greeks = {name: PricingResult.from_estimate(statistics.mean[i], statistics.std_error[i],
+                                                       engine.replications_used)
+                     for (i, name) in enumerate(MONTE_CARLO_GREEKS)}
+    return engine.greeks["price"]
+
+def Pathwise_Greeks_Pricer(engine, option, data):
+    """Price with delta, vega and gamma estimated in the same pass, for any payoff declared
+    through payoff_inputs (vanilla, Asian, lookback).  Read them from engine.greeks or call
+    engine.calculate_greeks.  Pathwise estimates need a payoff continuous in its inputs."""
+    return _greeks_result(engine, option, data, _pathwise_greek_samples)
+
+def Likelihood_Ratio_Greeks_Pricer(engine, option, data):
+    """As Pathwise_Greeks_Pricer, with likelihood-ratio estimates that also cover
+    discontinuous payoffs."""
+    return _greeks_result(engine, option, data, _likelihood_ratio_greek_samples)
+
+
+def _path_samples(engine, option, data, rng, n):
+    (spot, rate, volatility, dividend) = MarketInputs(data, option)
+    discount_rate = np.exp(-rate * option.expiry)
+    statistics = engine.path_statistics(option, data, None, n, engine.time_steps, rng)
+    samples = option.payoff(*statistics, out = statistics[0])
+    samples *= discount_rate
+    return samples
+
+def Path_Monte_Carlo_Pricer(engine, option, data):
+    """Monte Carlo for any payoff declared through payoff_inputs: the engine accumulates only the
+    path statistics the payoff asks for, e.g. the average for arithmetic_asian_put_payoff."""
+    statistics = engine.simulate(_path_samples, option, data)
+    return PricingResult.from_estimate(statistics.mean, statistics.std_error, engine.replications_used)
+
+
+class PolynomialBasis(object):
+    """Regression basis 1, x, x^2, ..., x^degree in the moneyness x = spot / strike."""
+
+    def __init__(self, degree = 3):
+        self.degree = degree
+
+    def __call__(self, x):
+        return x[..., np.newaxis] ** np.arange(self.degree + 1)
+
+
+class LaguerreBasis(object):
+    """Weighted Laguerre polynomials exp(-x / 2) L_j(x), j = 0, ..., degree, in the moneyness
+    x = spot / strike, the basis of Longstaff and Schwartz."""
+
+    def __init__(self, degree = 3):
+        self.degree = degree
+
+    def __call__(self, x):
+        basis = np.empty(x.shape + (self.degree + 1, ))
+        basis[..., 0] = 1.0
+        if self.degree > 0:
+            basis[..., 1] = 1.0 - x
+        for j in range(1, self.degree):
+            basis[..., j + 1] = ((2 * j + 1 - x) * basis[..., j] - j * basis[..., j - 1]) / (j + 1)
+        basis *= np.exp(-0.5 * x)[..., np.newaxis]
+        return basis
+
+
+class LongstaffSchwartzPricingEngine(MonteCarloPricingEngine):
+    """Least-squares Monte Carlo for early exercise.  Each of the time_steps dates is an exercise
+    date (a Bermudan schedule; many dates approximate American exercise).  The pricer fits the
+    continuation value on training_replications paths by regressing discounted cash flows on
+    basis(spot / strike) over the in-the-money paths at every date, then values that exercise
+    rule on replications fresh paths through simulate, so the price is a low-biased (lower
+    bound) estimate and every MonteCarloPricingEngine option (chunks, workers, sampling layers)
+    applies.  With bounds = True an Andersen-Broadie duality upper bound is also estimated from
+    outer_replications paths with inner_replications nested paths per exercise date, and both
+    bounds are kept in bounds as ((lower, std_error), (upper, std_error))."""
+
+    _results = MonteCarloPricingEngine._results + ("coefficients", "bounds")
+
+    def __init__(self, replications, time_steps, pricer, basis = None, training_replications = None,
+                 bounds = False, outer_replications = 256, inner_replications = 256, **kwargs):
+        super(LongstaffSchwartzPricingEngine, self).__init__(replications, time_steps, pricer, **kwargs)
+        self.__basis = LaguerreBasis(3) if basis is None else basis
+        self.__training_replications = training_replications
+        self.__estimate_bounds = bounds
+        self.__outer_replications = outer_replications
+        self.__inner_replications = inner_replications
+        self.__coefficients = None
+        self.__bound_estimates = None
+
+    @property
+    def basis(self):
+        return self.__basis
+
+    @basis.setter
+    def basis(self, new_basis):
+        self.__basis = new_basis
+
+    @property
+    def training_replications(self):
+        return self.__training_replications or self.replications
+
+    @training_replications.setter
+    def training_replications(self, new_training_replications):
+        self.__training_replications = new_training_replications
+
+    @property
+    def estimate_bounds(self):
+        return self.__estimate_bounds
+
+    @estimate_bounds.setter
+    def estimate_bounds(self, new_estimate_bounds):
+        self.__estimate_bounds = new_estimate_bounds
+
+    @property
+    def outer_replications(self):
+        return self.__outer_replications
+
+    @property
+    def inner_replications(self):
+        return self.__inner_replications
+
+    @property
+    def coefficients(self):
+        """(time_steps, basis size) regression coefficients of the continuation value, one row
+        per exercise date; the row for the final date is zero."""
+        return self.__coefficients
+
+    @coefficients.setter
+    def coefficients(self, new_coefficients):
+        self.__coefficients = new_coefficients
+
+    @property
+    def bounds(self):
+        return self.__bound_estimates
+
+    @bounds.setter
+    def bounds(self, new_bounds):
+        self.__bound_estimates = new_bounds
+
+
+def _exercise_rule_values(engine, option, spots, first_date, discount_step):
+    """Value of following the fitted exercise rule along spots, an (n, dates) array of spots on
+    exercise dates first_date, ..., time_steps (dates count from 1), discounted to the date
+    before first_date."""
+    time_steps = int(engine.time_steps)
+    (n, dates) = spots.shape
+    exercise = option.payoff(spots)
+    coefficients = engine.coefficients[first_date - 1:]
+    continuation = np.einsum("njp,jp->nj", engine.basis(spots / option.strike), coefficients)
+    continuation[:, time_steps - first_date] = 0.0
+    stop = (exercise > 0.0) & (exercise > continuation)
+    first = np.argmax(stop, axis = 1)
+    value = exercise[np.arange(n), first] * np.exp(-discount_step * (first + 1))
+    return np.where(stop.any(axis = 1), value, 0.0)
+
+
+def _longstaff_schwartz_samples(engine, option, data, rng, n):
+    (spot, rate, volatility, dividend) = MarketInputs(data, option)
+    delta_t = option.expiry / int(engine.time_steps)
+    paths = engine.paths(option, data, n, engine.time_steps, rng)
+    return _exercise_rule_values(engine, option, paths[:, 1:], 1, rate * delta_t)
+
+
+def LongstaffSchwartzCoefficients(engine, option, data, rng):
+    """Backward induction of Longstaff and Schwartz on training paths: at each date the
+    discounted realised cash flows of the in-the-money paths are regressed on the basis and
+    paths whose exercise value beats the fitted continuation value exercise there."""
+    (spot, rate, volatility, dividend) = MarketInputs(data, option)
+    time_steps = int(engine.time_steps)
+    discount = np.exp(-rate * option.expiry / time_steps)
+    paths = engine.paths(option, data, int(engine.training_replications), time_steps, rng)
+    cash_flow = option.payoff(paths[:, -1])
+    coefficients = np.zeros((time_steps, engine.basis(np.ones(1)).shape[-1]))
+
+    for k in range(time_steps - 1, 0, -1):
+        cash_flow *= discount
+        exercise = option.payoff(paths[:, k])
+        itm = np.flatnonzero(exercise > 0.0)
+        if itm.size == 0:
+            continue
+        basis = engine.basis(paths[itm, k] / option.strike)
+        (coefficients[k - 1], residuals, rank, singular) = np.linalg.lstsq(basis, cash_flow[itm], rcond = None)
+        stop = exercise[itm] > np.dot(basis, coefficients[k - 1])
+        cash_flow[itm[stop]] = exercise[itm[stop]]
+    return coefficients
+
+
+def AndersenBroadieUpperBound(engine, option, data, rng):
+    """Duality upper bound for the fitted exercise rule: E[max_k (D_k h_k - M_k)] with the
+    martingale M built from the rule's value process, whose continuation values come from
+    inner_replications nested paths started at every outer path and exercise date.
+    Returns (upper, std_error)."""
+    (spot, rate, volatility, dividend) = MarketInputs(data, option)
+    time_steps = int(engine.time_steps)
+    delta_t = option.expiry / time_steps
+    (outer, inner) = (int(engine.outer_replications), int(engine.inner_replications))
+    paths = engine.paths(option, data, outer, time_steps, rng)
+    exercise = option.payoff(paths)
+    discount = np.exp(-rate * delta_t * np.arange(time_steps + 1))
+
+    """continuation[:, k]: value at date k of following the rule from date k + 1 on."""
+    continuation = np.empty((outer, time_steps))
+    for k in range(time_steps):
+        start = np.repeat(paths[:, k], inner)[:, np.newaxis]
+        z = rng.standard_normal(size = (outer * inner, time_steps - k))
+        nested = GeometricBrownianPaths(start, rate, volatility, dividend, (time_steps - k) * delta_t, z)
+        values = _exercise_rule_values(engine, option, nested[:, 1:], k + 1, rate * delta_t)
+        continuation[:, k] = values.reshape(outer, inner).mean(axis = 1)
+
+    dates = np.arange(1, time_steps)
+    fitted = np.einsum("njp,jp->nj", engine.basis(paths[:, dates] / option.strike), engine.coefficients[dates - 1])
+    rule_continues = ~((exercise[:, dates] > 0.0) & (exercise[:, dates] > fitted))
+    value = np.empty((outer, time_steps + 1))
+    value[:, dates] = np.where(rule_continues, continuation[:, dates], exercise[:, dates])
+    value[:, time_steps] = exercise[:, time_steps]
+
+    martingale = np.zeros((outer, time_steps + 1))
+    martingale[:, 1:] = np.cumsum(discount[1:] * value[:, 1:] - discount[:-1] * continuation, axis = 1)
+    upper = np.max(discount * exercise - martingale, axis = 1)
+    return (upper.mean(), upper.std(ddof = 1) / np.sqrt(outer))
+
+
+def LongstaffSchwartzPricer(engine, option, data):
+    """Price an American or Bermudan VanillaPayoff with a LongstaffSchwartzPricingEngine."""
+    (training_seed, bound_seed) = np.random.SeedSequence(engine.seed).spawn(2)
+    engine.coefficients = LongstaffSchwartzCoefficients(engine, option, data, np.random.default_rng(training_seed))
+    statistics = engine.simulate(_longstaff_schwartz_samples, option, data)
+    (price, std_error) = (statistics.mean, statistics.std_error)
+    (spot, rate, volatility, dividend) = MarketInputs(data, option)
+    price = max(price, option.payoff(spot))
+    if engine.estimate_bounds:
+        upper = AndersenBroadieUpperBound(engine, option, data, np.random.default_rng(bound_seed))
+        engine.bounds = ((price, std_error), upper)
+    return PricingResult.from_estimate(price, std_error, engine.replications_used)
@@ -1,4 +1,10 @@
 import abc
+import weakref
+from collections import OrderedDict
+import numpy as np
+from .payoff import VanillaPayoff, call_payoff, put_payoff
+from .engine import _state_key, _hashable, _term_values
+from .marketdata import MarketData, MarketDataStore, YieldCurve, VolatilitySurface
 
 class OptionFacade(object, metaclass=abc.ABCMeta):
     """An option. -- Using Facade design pattern.  This instantiates the price method for the price engine.
@@ -6,17 +12,245 @@ class OptionFacade(object, metaclass=abc.ABCMeta):
 
     """
 
-    def __init__(self, option, engine, data):
+    def __init__(self, option, engine, data, cache = None):
         self.option = option
         self.engine = engine
         self.data = data
+        self.cache = cache
 
 
-    def price(self):
-        return self.engine.calculate(self.option, self.data)
-        
-      
+    def price(self, result = False):
+        """The option price, or a PricingResult carrying its standard error, confidence
+        interval, path count and wall time when result is True.  With a PriceCache attached,
+        repeat requests for an unchanged option, engine and market are served from it."""
+        if self.cache is None:
+            return self.engine.calculate(self.option, self.data, result)
+        return self.cache.price(self.option, self.engine, self.data, result)
 
 
+class PriceCache(object):
+    """An opt-in, bounded LRU cache of PricingResults, shared by any number of OptionFacades.
 
-        
+    Entries are keyed on the engine's cache_key (its type and configuration), the payoff's
+    attributes and MarketData.get_data().  Engines whose cache_key is None, i.e. Monte Carlo
+    engines without a fixed seed, are always priced afresh.  A MarketData setter drops every
+    entry priced off that MarketData.  A cached hit does not rerun the engine, so per-run state
+    such as a Monte Carlo engine's statistics is that of the run that filled the entry.
+    """
+
+    def __init__(self, maxsize = 1024):
+        self.__maxsize = maxsize
+        self.__entries = OrderedDict()
+        self.__keys_by_data = weakref.WeakKeyDictionary()
+        self.__hits = 0
+        self.__misses = 0
+
+    @property
+    def maxsize(self):
+        return self.__maxsize
+
+    @property
+    def hits(self):
+        return self.__hits
+
+    @property
+    def misses(self):
+        return self.__misses
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def clear(self):
+        self.__entries.clear()
+        for keys in self.__keys_by_data.values():
+            keys.clear()
+
+    def invalidate(self, data):
+        """Drop the entries priced off this MarketData object."""
+        keys = self.__keys_by_data.get(data, set())
+        for key in keys:
+            self.__entries.pop(key, None)
+        keys.clear()
+
+    def price(self, option, engine, data, result = False):
+        engine_key = engine.cache_key() if hasattr(engine, "cache_key") else None
+        if engine_key is None:
+            return engine.calculate(option, data, result)
+        key = (engine_key, (type(option), _state_key(option)), _hashable(data.get_data()))
+        entry = self.__entries.get(key)
+        if entry is None:
+            self.__misses += 1
+            entry = (engine.calculate(option, data, result = True), weakref.ref(data))
+            self.__entries[key] = entry
+            if data not in self.__keys_by_data:
+                self.__keys_by_data[data] = set()
+                data.observe(self.invalidate)
+            self.__keys_by_data[data].add(key)
+            if len(self.__entries) > self.__maxsize:
+                (evicted, (_, evicted_data)) = self.__entries.popitem(last = False)
+                evicted_data = evicted_data()
+                if evicted_data is not None:
+                    self.__keys_by_data[evicted_data].discard(evicted)
+        else:
+            self.__hits += 1
+            self.__entries.move_to_end(key)
+        outcome = entry[0]
+        return outcome if result else outcome.price
+
+
+class PortfolioFacade(object):
+    """A book of vanilla options held column-wise rather than as one OptionFacade per trade.
+
+    trades is a columnar table (a dict of equal-length arrays, or a structured array) with
+    columns strike, expiry, payoff ("call" or "put") and underlying, plus optional engine and
+    quantity columns.  market maps each underlying id to its MarketData, or is a
+    MarketDataStore, whose columns are gathered for the whole book at once.  engines is either a
+    single engine for the whole book or a dict keyed by the values of the engine column.
+
+    Trades are grouped by engine; engines with a calculate_batch method (Black-Scholes) price
+    their whole group, across every underlying, in one vectorized call.  Other engines are
+    priced trade by trade within each (engine, underlying) group.
+    """
+
+    def __init__(self, trades, engines, market):
+        self.trades = trades
+        self.engines = engines
+        self.market = market
+
+    def __column(self, name, default = None):
+        try:
+            return np.asarray(self.trades[name])
+        except (KeyError, ValueError):
+            if default is None:
+                raise
+            return default
+
+    def __groups(self):
+        """(engine, trade indices) pairs, one per engine used in the book."""
+        size = len(self.__column("strike"))
+        if not isinstance(self.engines, dict):
+            return [(self.engines, np.arange(size))]
+        return [(self.engines[key], index) for (key, index) in _group(self.__column("engine"))]
+
+    def __market_columns(self, underlying, strike, expiry):
+        """Spot, rate, volatility and dividend per trade, looked up once per underlying.  Yield
+        curves and volatility surfaces are evaluated for each underlying's trades at once."""
+        (unique, inverse) = np.unique(underlying, return_inverse = True)
+        if isinstance(self.market, MarketDataStore):
+            return tuple(column[inverse] for column in self.market.get_data(unique))
+        data = [self.market[key].get_data() for key in unique.tolist()]
+        try:
+            data = np.array(data, dtype = np.float64).reshape(len(unique), 4)[inverse]
+            return (data[:, 0], data[:, 1], data[:, 2], data[:, 3])
+        except TypeError:
+            pass
+        columns = np.empty((4, len(underlying)))
+        for (position, index) in _group(inverse):
+            (spot, rate, volatility, dividend) = data[position]
+            (rate, volatility, dividend) = _term_values(strike[index], expiry[index], rate, volatility, dividend)
+            (columns[0, index], columns[1, index], columns[2, index], columns[3, index]) = (
+                spot, rate, volatility, dividend)
+        return tuple(columns)
+
+    def __trades(self):
+        strike = self.__column("strike").astype(np.float64)
+        expiry = self.__column("expiry").astype(np.float64)
+        payoff = self.__column("payoff")
+        underlying = self.__column("underlying")
+        quantity = self.__column("quantity", np.ones(len(strike)))
+        is_call = payoff == "call"
+        if not np.all(is_call | (payoff == "put")):
+            raise ValueError("You must pass either a call or a put option.")
+        return (strike, expiry, is_call, underlying, quantity)
+
+    def price(self, greeks = False):
+        """Columnar results: a dict of arrays aligned with the trade table holding price and
+        value (price times quantity) and, when greeks is True, the Black-Scholes Greeks."""
+        (strike, expiry, is_call, underlying, quantity) = self.__trades()
+        columns = {"price": np.empty(len(strike))}
+        for (engine, index) in self.__groups():
+            if hasattr(engine, "calculate_batch"):
+                (spot, rate, volatility, dividend) = self.__market_columns(underlying[index], strike[index],
+                                                                             expiry[index])
+                arguments = (strike[index], expiry[index], spot, volatility, rate, dividend, is_call[index])
+                if greeks:
+                    for (name, values) in engine.calculate_greeks_batch(*arguments).items():
+                        columns.setdefault(name, np.full(len(strike), np.nan))[index] = values
+                else:
+                    columns["price"][index] = engine.calculate_batch(*arguments)
+                continue
+            for i in index.tolist():
+                option = VanillaPayoff(expiry[i], strike[i], call_payoff if is_call[i] else put_payoff)
+                columns["price"][i] = engine.calculate(option, self.market[underlying[i].item()])
+        columns["value"] = columns["price"] * quantity
+        return columns
+
+    def scenario_pnl(self, spot_shocks = (0.0, ), volatility_shocks = (0.0, ), rate_shocks = (0.0, )):
+        """Revalue the book over the grid of every combination of relative spot shocks, absolute
+        volatility shocks and parallel rate shifts.  Returns (pnl, scenarios): a (trades,
+        scenarios) matrix of value changes against the unshocked book and the (scenarios, 3)
+        grid of (spot, volatility, rate) shocks.
+
+        Black-Scholes groups price the whole trades x scenarios grid in one broadcast call.
+        Monte Carlo groups draw one set of terminal normals per trade and revalue every scenario
+        from it.  Other engines reprice each trade per scenario, and seeded ones (given a seed
+        for the run when they have none) reuse the same random numbers in every scenario, so
+        the P&L carries no noise from redrawing paths."""
+        (strike, expiry, is_call, underlying, quantity) = self.__trades()
+        grid = np.stack(np.meshgrid(spot_shocks, volatility_shocks, rate_shocks, indexing = "ij"), -1)
+        scenarios = np.concatenate((np.zeros((1, 3)), grid.reshape(-1, 3)))
+        (spot_shock, volatility_shock, rate_shock) = scenarios.T
+        values = np.empty((len(strike), len(scenarios)))
+
+        for (engine, index) in self.__groups():
+            if hasattr(engine, "calculate_batch"):
+                (spot, rate, volatility, dividend) = (column[:, np.newaxis] for column in self.__market_columns(
+                    underlying[index], strike[index], expiry[index]))
+                values[index] = engine.calculate_batch(
+                    strike[index, np.newaxis], expiry[index, np.newaxis], spot * (1.0 + spot_shock),
+                    volatility + volatility_shock, rate + rate_shock, dividend, is_call[index, np.newaxis])
+                continue
+            seed = getattr(engine, "seed", False)
+            if seed is None:
+                engine.seed = np.random.SeedSequence().entropy
+            try:
+                shocked = {}
+                for i in index.tolist():
+                    option = VanillaPayoff(expiry[i], strike[i], call_payoff if is_call[i] else put_payoff)
+                    key = underlying[i].item()
+                    if key not in shocked:
+                        shocked[key] = [_shocked(self.market[key], *shock) for shock in scenarios.tolist()]
+                    if hasattr(engine, "calculate_scenarios"):
+                        values[i] = engine.calculate_scenarios(option, shocked[key])
+                    else:
+                        values[i] = [engine.calculate(option, data) for data in shocked[key]]
+            finally:
+                if seed is None:
+                    engine.seed = None
+
+        pnl = quantity[:, np.newaxis] * (values[:, 1:] - values[:, :1])
+        return (pnl, scenarios[1:])
+
+
+def _group(keys):
+    """(key, indices) pairs for the distinct values of an array, in sorted key order."""
+    (unique, inverse) = np.unique(keys, return_inverse = True)
+    order = np.argsort(inverse, kind = "stable")
+    bounds = np.searchsorted(inverse[order], np.arange(len(unique) + 1))
+    return [(key, order[bounds[i]:bounds[i + 1]]) for (i, key) in enumerate(unique.tolist())]
+
+
+def _shocked(data, spot_shock, volatility_shock, rate_shock):
+    """A MarketData with the spot scaled by 1 + spot_shock and the volatility and rate shifted,
+    yield curves and volatility surfaces in parallel."""
+    (spot, rate, volatility, dividend) = data.get_data()
+    return MarketData(_shifted(rate, rate_shock), spot * (1.0 + spot_shock),
+                      _shifted(volatility, volatility_shock), dividend)
+
+
+def _shifted(value, shift):
+    if isinstance(value, YieldCurve):
+        return YieldCurve(value.times, value.rates + shift, value.method)
+    if isinstance(value, VolatilitySurface):
+        return VolatilitySurface(value.strikes, value.expiries, value.volatilities + shift, value.method)
+    return value + shift
@@ -1,3 +1,7 @@
+import weakref
+import numpy as np
+
+
 class MarketData(object):
     """A class to encapsulate market data variables.
        Especially to be passed to pricing engines.
@@ -8,6 +12,7 @@ class MarketData(object):
         self.__spot = spot
         self.__volatility = volatility
         self.__dividend = dividend
+        self.__observers = []
 
     @property
     def rate(self):
@@ -16,6 +21,7 @@ class MarketData(object):
     @rate.setter
     def rate(self, new_rate):
         self.__rate = new_rate
+        self._changed()
 
     @property
     def spot(self):
@@ -24,6 +30,7 @@ class MarketData(object):
     @spot.setter
     def spot(self, new_spot):
         self.__spot = new_spot
+        self._changed()
 
     @property
     def volatility(self):
@@ -32,6 +39,7 @@ class MarketData(object):
     @volatility.setter
     def volatility(self, new_volatility):
         self.__volatility = new_volatility
+        self._changed()
 
     @property
     def dividend(self):
@@ -40,6 +48,342 @@ class MarketData(object):
     @dividend.setter
     def dividend(self, new_yield):
         self.__dividend = new_yield
+        self._changed()
         
+    def observe(self, callback):
+        """Call callback(self) whenever a setter changes the data, e.g. to drop cached prices."""
+        self.__observers.append(callback)
+
+    def _changed(self):
+        """Notify the observers that the data has changed."""
+        for callback in self.__observers:
+            callback(self)
+
     def get_data(self):
         return (self.__spot, self.__rate, self.__volatility, self.__dividend)
+
+
+"""Rows of a MarketDataStore block, in the order get_data returns them."""
+SPOT, RATE, VOLATILITY, DIVIDEND = range(4)
+
+
+class MarketDataStore(object):
+    """Columnar market data for many underlyings.
+
+    The spots, rates, volatilities and dividends live in one contiguous (4, n) float64 block,
+    one row per field in get_data order, with an id -> position dict for O(1) lookup.
+    get_data() and the spot, rate, volatility and dividend properties hand out read-only,
+    zero-copy row views, so a store (or a slice of one, store[i:j]) can be passed to a
+    vectorized engine wherever a MarketData is expected.  store[id] is a MarketData view of one
+    underlying whose setters write through to the block.  Changes go through update, which
+    writes a whole tick in place and notifies any live views of the ids it touched, and
+    observers of the store and its slices are notified of every change, as for MarketData.
+    """
+
+    def __init__(self, ids, rate, spot, volatility, dividend):
+        ids = tuple(ids)
+        block = np.empty((4, len(ids)))
+        (block[SPOT], block[RATE], block[VOLATILITY], block[DIVIDEND]) = (spot, rate, volatility, dividend)
+        self.__ids = ids
+        self.__index = {key: position for (position, key) in enumerate(ids)}
+        if len(self.__index) != len(ids):
+            raise ValueError("Underlying ids must be unique.")
+        self.__block = block
+        self.__views = weakref.WeakValueDictionary()
+        self.__observers = []
+        self.__root = self
+        self.__offset = 0
+
+    @classmethod
+    def from_market_data(cls, market):
+        """A store holding the current values of a dict of id -> MarketData."""
+        ids = list(market)
+        (spot, rate, volatility, dividend) = np.array([market[key].get_data() for key in ids],
+                                                      dtype = np.float64).reshape(len(ids), 4).T
+        return cls(ids, rate, spot, volatility, dividend)
+
+    @property
+    def ids(self):
+        return self.__ids
+
+    def __len__(self):
+        return len(self.__ids)
+
+    def __contains__(self, key):
+        return self.position(key, missing = -1) >= 0
+
+    def __row(self, row):
+        view = self.__block[row]
+        view.flags.writeable = False
+        return view
+
+    @property
+    def spot(self):
+        return self.__row(SPOT)
+
+    @property
+    def rate(self):
+        return self.__row(RATE)
+
+    @property
+    def volatility(self):
+        return self.__row(VOLATILITY)
+
+    @property
+    def dividend(self):
+        return self.__row(DIVIDEND)
+
+    def position(self, ids, missing = None):
+        """The position of an id, or an array of positions for a sequence of ids.  Unknown ids
+        raise KeyError unless a missing position is given."""
+        root = self.__root
+        if isinstance(ids, (list, tuple, np.ndarray)):
+            return np.array([self.position(key, missing) for key in np.asarray(ids).tolist()], dtype = np.intp)
+        position = root.__index.get(ids, -1) - self.__offset
+        if not 0 <= position < len(self.__ids):
+            if missing is None:
+                raise KeyError(ids)
+            return missing
+        return position
+
+    def observe(self, callback):
+        """Call callback(self) whenever the store changes, through update or a view's setters."""
+        self.__root.__observers.append((weakref.ref(self), callback))
+
+    def _changed(self):
+        """Notify the observers of the store and of its slices that the data has changed."""
+        root = self.__root
+        root.__observers = [(store, callback) for (store, callback) in root.__observers
+                            if store() is not None]
+        for (store, callback) in list(root.__observers):
+            callback(store())
+
+    def get_data(self, ids = None):
+        """(spot, rate, volatility, dividend) arrays: zero-copy views of every underlying, or
+        copies gathered for the given ids."""
+        if ids is None:
+            return (self.spot, self.rate, self.volatility, self.dividend)
+        return tuple(self.__block[:, self.position(ids)])
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            (start, stop, step) = key.indices(len(self.__ids))
+            if step != 1:
+                raise ValueError("Store slices must be contiguous.")
+            view = object.__new__(type(self))
+            view.__ids = self.__ids[start:stop]
+            view.__block = self.__block[:, start:stop]
+            view.__root = self.__root
+            view.__offset = self.__offset + start
+            return view
+        root = self.__root
+        position = self.position(key) + self.__offset
+        market = root.__views.get(position)
+        if market is None:
+            market = MarketDataView(root.__block[:, position], root)
+            root.__views[position] = market
+        return market
+
+    def update(self, ids, spot = None, rate = None, volatility = None, dividend = None):
+        """Write a tick for the given ids in place; fields left as None are unchanged."""
+        self.update_positions(self.position(ids), spot, rate, volatility, dividend)
+
+    def update_positions(self, positions, spot = None, rate = None, volatility = None, dividend = None):
+        """update for positions already resolved through position, e.g. by a tick feed that
+        maps its ids once."""
+        for (row, values) in ((SPOT, spot), (RATE, rate), (VOLATILITY, volatility), (DIVIDEND, dividend)):
+            if values is not None:
+                self.__block[row, positions] = values
+        views = self.__root.__views
+        if len(views):
+            touched = np.zeros(self.__root.__block.shape[1], dtype = bool)
+            touched[np.add(positions, self.__offset)] = True
+            for (position, market) in list(views.items()):
+                if touched[position]:
+                    MarketData._changed(market)
+        self.__root._changed()
+
+
+class MarketDataView(MarketData):
+    """The MarketData interface over one column of a MarketDataStore block.  Setters write
+    through to the store and notify observers of the view and of the store."""
+
+    def __init__(self, column, store = None):
+        super().__init__(None, None, None, None)
+        self.__column = column
+        self.__store = store
+
+    def _changed(self):
+        super()._changed()
+        if self.__store is not None:
+            self.__store._changed()
+
+    @property
+    def rate(self):
+        return float(self.__column[RATE])
+
+    @rate.setter
+    def rate(self, new_rate):
+        self.__column[RATE] = new_rate
+        self._changed()
+
+    @property
+    def spot(self):
+        return float(self.__column[SPOT])
+
+    @spot.setter
+    def spot(self, new_spot):
+        self.__column[SPOT] = new_spot
+        self._changed()
+
+    @property
+    def volatility(self):
+        return float(self.__column[VOLATILITY])
+
+    @volatility.setter
+    def volatility(self, new_volatility):
+        self.__column[VOLATILITY] = new_volatility
+        self._changed()
+
+    @property
+    def dividend(self):
+        return float(self.__column[DIVIDEND])
+
+    @dividend.setter
+    def dividend(self, new_yield):
+        self.__column[DIVIDEND] = new_yield
+        self._changed()
+
+    def get_data(self):
+        return tuple(self.__column.tolist())
+
+
+class _Interpolant(object):
+    """Piecewise linear or natural cubic spline interpolation through the knots (x, y), flat
+    beyond the end knots.  y may hold several curves on the same knots, one per leading index.
+    The per-interval polynomial coefficients are computed once, so a lookup is a searchsorted
+    and a Horner evaluation over whole arrays."""
+
+    def __init__(self, x, y, method = "linear"):
+        if method not in ("linear", "cubic"):
+            raise ValueError("The interpolation method must be either 'linear' or 'cubic'.")
+        x = np.asarray(x, dtype = np.float64)
+        y = np.asarray(y, dtype = np.float64)
+        if x.shape[0] == 1:
+            (x, y) = (np.append(x, x[0] + 1.0), np.concatenate((y, y), axis = -1))
+        if np.any(np.diff(x) <= 0.0):
+            raise ValueError("Interpolation knots must be strictly increasing.")
+        h = np.diff(x)
+        slope = np.diff(y, axis = -1) / h
+        coefficients = np.zeros(y.shape[:-1] + (x.shape[0] - 1, 4))
+        coefficients[..., 0] = y[..., :-1]
+        coefficients[..., 1] = slope
+        if method == "cubic" and x.shape[0] > 2:
+            """Second derivatives M of the natural spline from its tridiagonal system."""
+            n = x.shape[0]
+            system = np.zeros((n, n))
+            system[0, 0] = system[-1, -1] = 1.0
+            i = np.arange(1, n - 1)
+            system[i, i - 1] = h[:-1]
+            system[i, i] = 2.0 * (h[:-1] + h[1:])
+            system[i, i + 1] = h[1:]
+            rhs = np.zeros(y.shape[:-1] + (n, ))
+            rhs[..., 1:-1] = 6.0 * np.diff(slope, axis = -1)
+            m = np.linalg.solve(system, rhs[..., np.newaxis])[..., 0]
+            coefficients[..., 1] -= h * (2.0 * m[..., :-1] + m[..., 1:]) / 6.0
+            coefficients[..., 2] = 0.5 * m[..., :-1]
+            coefficients[..., 3] = np.diff(m, axis = -1) / (6.0 * h)
+        self.__x = x
+        self.__coefficients = coefficients
+
+    def __call__(self, x, rows = None):
+        """Interpolated values at x; with several curves, rows picks the curve for each x."""
+        x = np.clip(np.asarray(x, dtype = np.float64), self.__x[0], self.__x[-1])
+        interval = np.clip(np.searchsorted(self.__x, x, side = "right") - 1, 0, self.__x.shape[0] - 2)
+        coefficients = self.__coefficients[interval] if rows is None else self.__coefficients[rows, interval]
+        dx = x - self.__x[interval]
+        return ((coefficients[..., 3] * dx + coefficients[..., 2]) * dx + coefficients[..., 1]) * dx + coefficients[..., 0]
+
+
+class YieldCurve(object):
+    """Continuously compounded zero rates at times (in years), interpolated piecewise linearly
+    or by natural cubic spline and held flat beyond the first and last times.  A YieldCurve can
+    stand in for the rate (or dividend yield) of a MarketData: engines then use the zero rate
+    to each option's expiry."""
+
+    def __init__(self, times, rates, method = "linear"):
+        self.__times = np.asarray(times, dtype = np.float64)
+        self.__rates = np.asarray(rates, dtype = np.float64)
+        self.__method = method
+        self.__interpolant = _Interpolant(self.__times, self.__rates, method)
+
+    @property
+    def times(self):
+        return self.__times
+
+    @property
+    def rates(self):
+        return self.__rates
+
+    @property
+    def method(self):
+        return self.__method
+
+    def zero_rate(self, expiry):
+        return self.__interpolant(expiry)
+
+    def discount(self, expiry):
+        return np.exp(-self.zero_rate(expiry) * expiry)
+
+    def forward_rate(self, start, end):
+        """The continuously compounded forward rate from start to end."""
+        return (self.zero_rate(end) * end - self.zero_rate(start) * start) / (np.asarray(end) - start)
+
+
+class VolatilitySurface(object):
+    """Black-Scholes implied volatilities on a strike x expiry grid, volatilities having shape
+    (len(expiries), len(strikes)).  Each expiry's smile is interpolated in strike (linearly or
+    by natural cubic spline), and between expiries the total variance volatility^2 * expiry is
+    interpolated linearly in time; both are flat beyond the grid.  A VolatilitySurface can stand
+    in for the volatility of a MarketData: engines then use the volatility at each option's
+    strike and expiry."""
+
+    def __init__(self, strikes, expiries, volatilities, method = "linear"):
+        self.__strikes = np.asarray(strikes, dtype = np.float64)
+        self.__expiries = np.asarray(expiries, dtype = np.float64)
+        self.__volatilities = np.asarray(volatilities, dtype = np.float64).reshape(
+            self.__expiries.shape[0], self.__strikes.shape[0])
+        self.__method = method
+        self.__smiles = _Interpolant(self.__strikes, self.__volatilities, method)
+
+    @property
+    def strikes(self):
+        return self.__strikes
+
+    @property
+    def expiries(self):
+        return self.__expiries
+
+    @property
+    def volatilities(self):
+        return self.__volatilities
+
+    @property
+    def method(self):
+        return self.__method
+
+    def volatility(self, strike, expiry):
+        """Volatilities for broadcastable arrays of strikes and expiries."""
+        (strike, expiry) = np.broadcast_arrays(np.asarray(strike, dtype = np.float64),
+                                               np.asarray(expiry, dtype = np.float64))
+        expiries = self.__expiries
+        last = expiries.shape[0] - 1
+        upper = np.clip(np.searchsorted(expiries, expiry), 0, last)
+        lower = np.clip(upper - 1, 0, last)
+        lower_variance = self.__smiles(strike, lower) ** 2 * expiries[lower]
+        upper_variance = self.__smiles(strike, upper) ** 2 * expiries[upper]
+        span = expiries[upper] - expiries[lower]
+        weight = np.divide(expiry - expiries[lower], span, out = np.ones_like(span), where = span > 0.0)
+        weight = np.clip(weight, 0.0, 1.0)
+        time = np.clip(expiry, expiries[0], expiries[-1])
+        return np.sqrt(((1.0 - weight) * lower_variance + weight * upper_variance) / time)
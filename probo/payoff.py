@@ -1,5 +1,39 @@
 import abc
-from numpy import sqrt, maximum 
+from numpy import sqrt, maximum, subtract, power, divide
+
+
+"""The path statistics a payoff can be evaluated on.  Monte Carlo engines accumulate only the
+statistics a payoff declares, so they never need to hold whole paths for it."""
+TERMINAL = "terminal"
+AVERAGE = "average"
+GEOMETRIC_AVERAGE = "geometric_average"
+MAXIMUM = "maximum"
+MINIMUM = "minimum"
+PATH_STATISTICS = (TERMINAL, AVERAGE, GEOMETRIC_AVERAGE, MAXIMUM, MINIMUM)
+
+
+def payoff_inputs(*inputs):
+    """Declare the path statistics a payoff function takes, in order.  Declared functions are
+    array-native: they are called as payoff(option, *statistics, out = None) and write into out
+    when it is given."""
+    for name in inputs:
+        if name not in PATH_STATISTICS:
+            raise ValueError("Unknown path statistic '{}'.".format(name))
+    def declare(function):
+        function.inputs = inputs
+        return function
+    return declare
+
+
+def _evaluate(function, option, statistics, out):
+    """Call a payoff function, handing the out buffer only to functions declared through
+    payoff_inputs; undeclared functions are evaluated and then copied into out."""
+    if out is None:
+        return function(option, *statistics)
+    if hasattr(function, "inputs"):
+        return function(option, *statistics, out = out)
+    out[...] = function(option, *statistics)
+    return out
 
 
 class Payoff(object, metaclass=abc.ABCMeta):
@@ -19,6 +53,11 @@ class Payoff(object, metaclass=abc.ABCMeta):
     @abc.abstractmethod
     def payoff(self):
         pass
+
+    @property
+    def inputs(self):
+        """The path statistics the payoff is evaluated on; the terminal spot unless declared."""
+        return (TERMINAL, )
     
 class VanillaPayoff(Payoff):
     def __init__(self, expiry, strike, payoff):
@@ -42,15 +81,21 @@ class VanillaPayoff(Payoff):
     def strike(self, new_strike):
         self.__strike = new_strike
 
-    def payoff(self, spot):
-        return self.__payoff(self, spot)
+    @property
+    def inputs(self):
+        return getattr(self.__payoff, "inputs", (TERMINAL, ))
+
+    def payoff(self, *spot, out = None):
+        return _evaluate(self.__payoff, self, spot, out)
     
     
-def call_payoff(option, spot):
-    return maximum(spot - option.strike, 0.0)
+@payoff_inputs(TERMINAL)
+def call_payoff(option, spot, out = None):
+    return maximum(subtract(spot, option.strike, out = out), 0.0, out = out)
 
-def put_payoff(option, spot):
-    return maximum(option.strike - spot, 0.0)
+@payoff_inputs(TERMINAL)
+def put_payoff(option, spot, out = None):
+    return maximum(subtract(option.strike, spot, out = out), 0.0, out = out)
     
     
 class StrangePayoff(Payoff):
@@ -75,24 +120,32 @@ class StrangePayoff(Payoff):
     def strike(self, new_strike):
         self.__strike = new_strike
 
-    def payoff(self, spot):
-        return self.__payoff(self, spot)    
-    
-def sSquared_payoff(option, spot):
-    return spot ** 2.0
-    
-def sSqrt_payoff(option, spot):
-    return spot ** 0.5
+    @property
+    def inputs(self):
+        return getattr(self.__payoff, "inputs", (TERMINAL, ))
+
+    def payoff(self, *spot, out = None):
+        return _evaluate(self.__payoff, self, spot, out)    
     
-def sFrac_payoff(option, spot):
-    return spot ** -1.0
+@payoff_inputs(TERMINAL)
+def sSquared_payoff(option, spot, out = None):
+    return power(spot, 2.0, out = out)
+
+@payoff_inputs(TERMINAL)
+def sSqrt_payoff(option, spot, out = None):
+    return sqrt(spot, out = out)
+
+@payoff_inputs(TERMINAL)
+def sFrac_payoff(option, spot, out = None):
+    return divide(1.0, spot, out = out)
     
 
 class ExoticPayoff(Payoff):
-    def __init__(self, expiry, strike, payoff):
+    def __init__(self, expiry, strike, payoff, fixings = None):
         self.__expiry = expiry
         self.__strike = strike
         self.__payoff = payoff
+        self.__fixings = fixings
         
     @property
     def expiry(self):
@@ -110,11 +163,93 @@ class ExoticPayoff(Payoff):
     def strike(self, new_strike):
         self.__strike = new_strike
 
-    def payoff(self, spot):
-        return self.__payoff(self, spot)
+    @property
+    def fixings(self):
+        """Averaging dates in years (None for equal steps to expiry)."""
+        return self.__fixings
+
+    @property
+    def payoff_function(self):
+        """The payoff function the option was built on."""
+        return self.__payoff
+
+    @property
+    def inputs(self):
+        return getattr(self.__payoff, "inputs", (TERMINAL, ))
+
+    def payoff(self, *spot, out = None):
+        return _evaluate(self.__payoff, self, spot, out)
         
-def arithmetic_asian_call_payoff(option, spot):
-    return maximum(spot - option.strike, 0)
+@payoff_inputs(AVERAGE)
+def arithmetic_asian_call_payoff(option, average, out = None):
+    return maximum(subtract(average, option.strike, out = out), 0.0, out = out)
+
+@payoff_inputs(AVERAGE)
+def arithmetic_asian_put_payoff(option, average, out = None):
+    return maximum(subtract(option.strike, average, out = out), 0.0, out = out)
+
+@payoff_inputs(TERMINAL, AVERAGE)
+def floating_strike_asian_call_payoff(option, spot, average, out = None):
+    return maximum(subtract(spot, average, out = out), 0.0, out = out)
+
+@payoff_inputs(TERMINAL, AVERAGE)
+def floating_strike_asian_put_payoff(option, spot, average, out = None):
+    return maximum(subtract(average, spot, out = out), 0.0, out = out)
+
+
+class AsianPayoff(Payoff):
+    """An arithmetic-average Asian call or put on a discrete fixing schedule.  fixings are the
+    averaging dates in years (a fixing at 0.0 averages in today's spot); without them the
+    average is taken over the pricing engine's time steps to expiry.  A fixed-strike Asian pays
+    off on the average against strike, a floating-strike one (floating = True) on the spot at
+    expiry against the average."""
+
+    def __init__(self, expiry, strike, payoff_type = "call", fixings = None, floating = False):
+        if payoff_type not in ("call", "put"):
+            raise ValueError("You must pass either a call or a put option.")
+        self.__expiry = expiry
+        self.__strike = strike
+        self.__payoff_type = payoff_type
+        self.__fixings = fixings
+        self.__floating = floating
+
+    @property
+    def expiry(self):
+        return self.__expiry
+
+    @expiry.setter
+    def expiry(self, new_expiry):
+        self.__expiry = new_expiry
+
+    @property
+    def strike(self):
+        return self.__strike
+
+    @strike.setter
+    def strike(self, new_strike):
+        self.__strike = new_strike
+
+    @property
+    def payoff_type(self):
+        return self.__payoff_type
+
+    @property
+    def fixings(self):
+        return self.__fixings
+
+    @property
+    def floating(self):
+        return self.__floating
+
+    @property
+    def inputs(self):
+        return (TERMINAL, AVERAGE) if self.__floating else (AVERAGE, )
 
-def arithmetic_asian_put_payoff(option, spot):
-    pass
\ No newline at end of file
+    def payoff(self, *statistics, out = None):
+        if self.__floating:
+            (spot, average) = statistics
+            (high, low) = (spot, average) if self.__payoff_type == "call" else (average, spot)
+        else:
+            (average, ) = statistics
+            (high, low) = (average, self.__strike) if self.__payoff_type == "call" else (self.__strike, average)
+        return maximum(subtract(high, low, out = out), 0.0, out = out)